@@ -0,0 +1,129 @@
+# benchmarks/fake_groq.py
+"""
+Offline stand-in for the Groq client, for benchmarks and local runs.
+
+Install it in place of the real client with
+
+    import utils.llm_helper as llm_helper
+    llm_helper.groq_client = FakeGroqClient(latency=0.4, error_rate=0.05)
+
+It answers chat.completions.create(...) after a configurable delay, fails a
+configurable share of calls with a 503, and returns canned JSON (by default
+every REQUIRED_KEYS metric with a plausible number). Streaming requests get
+the same text back in small chunks. With requests_per_minute set, calls over
+that rate get a 429 with retry-after, and with_raw_response.create(...)
+returns Groq-style x-ratelimit-* headers, as utils.groq_gateway expects.
+"""
+import json
+import random
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+CHUNK_CHARS = 8
+# Quota reported in the x-ratelimit-* headers: Groq counts requests per day and tokens per minute.
+REQUESTS_PER_DAY = 14400
+TOKENS_PER_MINUTE = 1_000_000
+
+
+def default_canned_response():
+    from utils.llm_helper import REQUIRED_KEYS
+    return {key: round(1000.0 + 137.5 * position, 2) for position, key in enumerate(REQUIRED_KEYS)}
+
+
+class FakeGroqError(RuntimeError):
+    """Raised for simulated failures; carries a status_code and response headers like groq.APIStatusError."""
+
+    def __init__(self, message, status_code=503, headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+class _RawResponse:
+    def __init__(self, parsed, headers):
+        self._parsed = parsed
+        self.headers = headers
+
+    def parse(self):
+        return self._parsed
+
+
+class _Completions:
+    def __init__(self, client):
+        self._client = client
+        self.with_raw_response = SimpleNamespace(create=self._create_raw)
+
+    def create(self, model=None, messages=None, stream=False, **kwargs):
+        return self._client._complete(model, messages or [], stream)[0]
+
+    def _create_raw(self, model=None, messages=None, stream=False, **kwargs):
+        return _RawResponse(*self._client._complete(model, messages or [], stream))
+
+
+class FakeGroqClient:
+    def __init__(self, latency=0.3, jitter=0.1, error_rate=0.0, canned=None, seed=0, requests_per_minute=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests_per_minute = requests_per_minute
+        self.canned = canned if canned is not None else default_canned_response()
+        self.chat = SimpleNamespace(completions=_Completions(self))
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent = deque()   # start times of accepted calls in the last minute
+        self.calls = []   # one dict per call: seconds, failed, status, prompt_chars
+
+    def _admit(self):
+        """None if the call is within requests_per_minute, else seconds until it would be."""
+        if not self.requests_per_minute:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] >= 60.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.requests_per_minute:
+                return 60.0 - (now - self._recent[0])
+            self._recent.append(now)
+        return None
+
+    def _draw(self):
+        with self._lock:
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.error_rate
+        return delay, failed
+
+    def _complete(self, model, messages, stream):
+        """Returns (response, headers) or raises FakeGroqError."""
+        prompt_chars = sum(len(m.get("content") or "") for m in messages)
+        retry_after = self._admit()
+        if retry_after is not None:
+            with self._lock:
+                self.calls.append({"seconds": 0.0, "failed": True, "status": 429, "prompt_chars": prompt_chars})
+            raise FakeGroqError("Simulated rate limit", status_code=429, headers={"retry-after": f"{retry_after:.2f}"})
+
+        delay, failed = self._draw()
+        time.sleep(delay)
+        with self._lock:
+            self.calls.append({"seconds": delay, "failed": failed, "status": 503 if failed else 200,
+                               "prompt_chars": prompt_chars})
+        if failed:
+            raise FakeGroqError("Simulated Groq failure")
+
+        with self._lock:
+            served = sum(1 for call in self.calls if not call["failed"])
+        headers = {
+            "x-ratelimit-limit-requests": str(REQUESTS_PER_DAY),
+            "x-ratelimit-remaining-requests": str(max(0, REQUESTS_PER_DAY - served)),
+            "x-ratelimit-reset-requests": "1m26.4s",
+            "x-ratelimit-limit-tokens": str(TOKENS_PER_MINUTE),
+            "x-ratelimit-remaining-tokens": str(TOKENS_PER_MINUTE),
+            "x-ratelimit-reset-tokens": "0s",
+        }
+
+        text = self.canned if isinstance(self.canned, str) else json.dumps(self.canned)
+        if stream:
+            return (SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + CHUNK_CHARS]))])
+                    for i in range(0, len(text), CHUNK_CHARS)), headers
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))]), headers
@@ -0,0 +1,172 @@
+# benchmarks/ingestion.py
+"""
+End-to-end ingestion benchmark that runs without network access or API quota.
+
+    python benchmarks/ingestion.py temp_files --latency 0.4 --error-rate 0.05 --output ingest.json
+    python benchmarks/ingestion.py temp_files --no-local --repeat 3
+
+Every PDF in the directory goes through extract_pages_from_pdf ->
+process_pdf_pages -> save_financial_data with the Groq client replaced by
+benchmarks.fake_groq.FakeGroqClient. Each repeat uses a fresh temporary
+database, so the extraction cache starts cold. The JSON report holds
+per-document results plus pages/sec, LLM calls per document, p50/p95
+latency per stage and per LLM call, peak RSS and total DB write time.
+Use --no-local to skip the local statement parser and exercise the LLM path,
+and --rpm to have the fake answer 429 above a request rate, which exercises
+the retries and pacing in utils.groq_gateway.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_groq import FakeGroqClient
+import utils.database as database
+import utils.llm_helper as llm_helper
+from utils.pdf_processor import extract_pages_from_pdf
+from utils.telemetry import percentile, flush_spans
+from utils.groq_gateway import gateway_stats
+from ingest import year_from_filename
+
+DEFAULT_YEAR = 2024
+
+
+def _latency(values):
+    return {"p50": percentile(values, 0.50), "p95": percentile(values, 0.95), "count": len(values)}
+
+
+def _peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS.
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit,
+    }
+
+
+def run_document(pdf_path, company_id, year, pdf_workers, use_local):
+    """Runs one document through the three stages and times each of them."""
+    result = {"file": os.path.basename(pdf_path), "year": year, "status": "done"}
+    started = time.perf_counter()
+    pages = extract_pages_from_pdf(pdf_path, workers=pdf_workers, with_page_numbers=True)
+    extracted = time.perf_counter()
+    if not pages:
+        # Unreadable or scanned: nothing reaches the LLM, but the run goes on.
+        result.update(status="failed", error="No text could be extracted", pages=0, llm_calls=0,
+                      extract_seconds=extracted - started, process_seconds=0.0, save_seconds=None,
+                      total_seconds=extracted - started)
+        return result
+
+    stats = {}
+    financial_data = llm_helper.process_pdf_pages(pages, year, stats=stats, pdf_path=pdf_path, use_local=use_local)
+    processed = time.perf_counter()
+
+    result.update(pages=len(pages), llm_calls=stats.get("llm_calls_dispatched", 0),
+                  extract_seconds=extracted - started, process_seconds=processed - extracted, save_seconds=None)
+    if "error" in financial_data:
+        result.update(status="failed", error=financial_data["error"])
+    else:
+        database.save_financial_data(company_id, year, financial_data, result["file"])
+        result["save_seconds"] = time.perf_counter() - processed
+        result["keys_filled"] = sum(1 for key in llm_helper.REQUIRED_KEYS if financial_data.get(key) is not None)
+    result["total_seconds"] = time.perf_counter() - started
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PDF ingestion against an offline Groq stand-in.")
+    parser.add_argument("directory", help="Directory of PDF reports (e.g. temp_files)")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mean fake LLM latency in seconds (default 0.3)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Uniform +/- jitter on the latency (default 0.1)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of fake LLM calls that fail (default 0)")
+    parser.add_argument("--rpm", type=int, help="Requests per minute the fake LLM accepts before answering 429")
+    parser.add_argument("--canned", help="JSON file with the response the fake LLM returns")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for latency and error draws")
+    parser.add_argument("--no-local", action="store_true", help="Skip the local statement parser")
+    parser.add_argument("--pdf-workers", type=int, default=1, help="Processes used to parse each PDF (default 1)")
+    parser.add_argument("--company-id", type=int, default=1, help="Company the results are saved under (default 1)")
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the directory, each with a fresh database")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    canned = None
+    if args.canned:
+        with open(args.canned) as f:
+            canned = json.load(f)
+    client = FakeGroqClient(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            canned=canned, seed=args.seed, requests_per_minute=args.rpm)
+    llm_helper.groq_client = client
+
+    pdfs = sorted(os.path.join(args.directory, name) for name in os.listdir(args.directory) if name.lower().endswith(".pdf"))
+    source_db = os.path.join(REPO_ROOT, "data", "financial_data.db")
+    workdir = tempfile.mkdtemp(prefix="ingest-bench-")
+    documents = []
+    started = time.perf_counter()
+    try:
+        for run in range(args.repeat):
+            database.DB_NAME = os.path.join(workdir, f"run{run}.db")
+            if os.path.exists(source_db):
+                shutil.copy(source_db, database.DB_NAME)
+            database.setup_database()
+            for pdf_path in pdfs:
+                year = year_from_filename(os.path.basename(pdf_path)) or DEFAULT_YEAR
+                result = run_document(pdf_path, args.company_id, year, args.pdf_workers, not args.no_local)
+                result["run"] = run
+                documents.append(result)
+                print(f"[{result['status']}] {result['file']}: {result['pages']} pages, {result['llm_calls']} LLM calls, "
+                      f"{result['total_seconds']:.2f}s", file=sys.stderr)
+            database.close_db_connection()
+    finally:
+        # Spans still buffered belong to the temporary database; write them before it goes.
+        flush_spans()
+        shutil.rmtree(workdir, ignore_errors=True)
+    wall = time.perf_counter() - started
+
+    total_pages = sum(d["pages"] for d in documents)
+    saved = [d["save_seconds"] for d in documents if d["save_seconds"] is not None]
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "documents": documents,
+        "summary": {
+            "documents": len(documents),
+            "failed": sum(d["status"] != "done" for d in documents),
+            "pages": total_pages,
+            "wall_seconds": wall,
+            "pages_per_second": total_pages / wall if wall else 0.0,
+            "llm_calls": len(client.calls),
+            "llm_errors": sum(call["failed"] for call in client.calls),
+            "llm_rate_limited": sum(call["status"] == 429 for call in client.calls),
+            "llm_calls_per_document": len(client.calls) / len(documents) if documents else 0.0,
+            "stage_latency_seconds": {
+                "extract": _latency([d["extract_seconds"] for d in documents]),
+                "process": _latency([d["process_seconds"] for d in documents]),
+                "save": _latency(saved),
+                "document": _latency([d["total_seconds"] for d in documents]),
+                "llm_call": _latency([call["seconds"] for call in client.calls]),
+            },
+            "db_write_seconds": sum(saved),
+            "peak_rss_mb": _peak_rss_mb(),
+            "gateway": gateway_stats(),
+        },
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
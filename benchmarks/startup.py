@@ -0,0 +1,138 @@
+# benchmarks/startup.py
+"""
+Cold-start benchmark for the Streamlit entry points.
+
+    python benchmarks/startup.py --repeat 5 --output startup.json
+
+For app.py, pages/Dashboard.py and pages/upload_pdf.py it measures, each in
+a fresh interpreter:
+  - import_seconds: running the script's own top-level imports
+  - first_render_seconds: the first AppTest run (imports + first render)
+  - rerun_seconds: a second run in the same process, as on any interaction
+and lists which heavy libraries ended up loaded. Runs use a copy of the
+database in a temporary directory, so the real one is never touched.
+Results are printed as JSON (medians and minimums over --repeat runs).
+"""
+import argparse
+import ast
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ["app.py", "pages/Dashboard.py", "pages/upload_pdf.py"]
+HEAVY_MODULES = ["pandas", "numpy", "plotly", "groq", "pdfplumber"]
+DB_PATH = os.path.join("data", "financial_data.db")
+
+# Pages behind the login are rendered as this user.
+SESSION = {"logged_in": True, "user_id": 1, "username": "analyst", "role": "analyst"}
+
+
+def _import_statements(script):
+    """The script's top-level import statements, as source text."""
+    with open(os.path.join(REPO_ROOT, script)) as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+def _run_worker(mode, script, workdir):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    # No key is needed: nothing here calls the API, and the client is only built on first use.
+    env.setdefault("GROQ_API_KEY", "benchmark")
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", mode, script],
+        cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def worker(mode, script):
+    """Runs inside the fresh interpreter; prints one JSON line."""
+    if mode == "import":
+        source = _import_statements(script)
+        import streamlit  # the framework itself is the same for every page
+        started = time.perf_counter()
+        exec(compile(source, script, "exec"), {})
+        result = {"import_seconds": time.perf_counter() - started}
+    else:
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_file(os.path.join(REPO_ROOT, script), default_timeout=120)
+        if script != "app.py":
+            for key, value in SESSION.items():
+                at.session_state[key] = value
+        started = time.perf_counter()
+        at.run()
+        first = time.perf_counter() - started
+        started = time.perf_counter()
+        at.run()
+        result = {
+            "first_render_seconds": first,
+            "rerun_seconds": time.perf_counter() - started,
+            "exceptions": [e.message for e in at.exception],
+            "heavy_modules_loaded": [name for name in HEAVY_MODULES if name in sys.modules],
+        }
+    print(json.dumps(result))
+
+
+def _summary(values):
+    return {"median": statistics.median(values), "min": min(values)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import time and time-to-first-render of the Streamlit pages.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh-process runs per measurement (default 5)")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--worker", nargs=2, metavar=("MODE", "SCRIPT"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        worker(*args.worker)
+        return 0
+
+    workdir = tempfile.mkdtemp(prefix="startup-bench-")
+    try:
+        os.makedirs(os.path.join(workdir, "data"))
+        source_db = os.path.join(REPO_ROOT, DB_PATH)
+        if os.path.exists(source_db):
+            shutil.copy(source_db, os.path.join(workdir, DB_PATH))
+        # Bring the copy up to the current schema once, outside the timings.
+        subprocess.run([sys.executable, "-c", "from utils.database import setup_database; setup_database()"],
+                       cwd=workdir, env=dict(os.environ, PYTHONPATH=REPO_ROOT), check=True, capture_output=True)
+
+        results = {}
+        for script in ENTRY_POINTS:
+            imports, renders = [], []
+            for _ in range(args.repeat):
+                imports.append(_run_worker("import", script, workdir))
+                renders.append(_run_worker("render", script, workdir))
+            results[script] = {
+                "import_seconds": _summary([r["import_seconds"] for r in imports]),
+                "first_render_seconds": _summary([r["first_render_seconds"] for r in renders]),
+                "rerun_seconds": _summary([r["rerun_seconds"] for r in renders]),
+                "heavy_modules_loaded": renders[-1]["heavy_modules_loaded"],
+                "exceptions": renders[-1]["exceptions"],
+            }
+            print(f"{script}: import {results[script]['import_seconds']['median']:.3f}s, "
+                  f"first render {results[script]['first_render_seconds']['median']:.3f}s, "
+                  f"rerun {results[script]['rerun_seconds']['median']:.3f}s", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"python": platform.python_version(), "platform": platform.platform(), "repeat": args.repeat,
+              "results": results}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
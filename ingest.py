@@ -0,0 +1,140 @@
+# ingest.py
+"""
+Headless batch ingestion of annual reports.
+
+    python ingest.py temp_files --company "Reliance Jio Infocomm" --workers 2
+    python ingest.py temp_files --mapping reports.json
+
+The mapping file is JSON of the form
+    {"consolidated.pdf": {"company": "Reliance Industries Limited (Consolidated)", "year": 2024}}
+Files not listed fall back to --company and to a year read from the file
+name ("fy-2023-24" -> 2024). Finished files are recorded in the ingest_jobs
+table, so re-running after a crash only processes what is left.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from utils.database import setup_database, get_all_companies, get_company_by_name
+from utils.ingestion import ingest_document
+
+FY_IN_NAME = re.compile(r"((?:19|20)\d\d)\s*[-_]\s*(\d\d)(?!\d)")
+YEAR_IN_NAME = re.compile(r"(?<!\d)((?:19|20)\d\d)(?!\d)")
+
+
+def _slug(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def year_from_filename(filename):
+    """Reads the fiscal year from a file name; FY ranges map to their closing year."""
+    match = FY_IN_NAME.search(filename)
+    if match:
+        return int(match.group(1)[:2] + match.group(2))
+    years = YEAR_IN_NAME.findall(filename)
+    return int(years[-1]) if years else None
+
+
+def company_from_filename(filename, companies):
+    """Returns the company whose name appears in the file name, longest match first."""
+    slug = _slug(filename)
+    for company in sorted(companies, key=lambda c: len(c["name"]), reverse=True):
+        if _slug(company["name"]) in slug:
+            return company
+    return None
+
+
+def plan_jobs(directory, mapping, default_company, default_year):
+    """Maps every PDF in the directory to (path, company, year), or an error string."""
+    companies = get_all_companies()
+    plan = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.lower().endswith(".pdf"):
+            continue
+        entry = mapping.get(filename, {})
+        company_name = entry.get("company") or default_company
+        if company_name:
+            company = get_company_by_name(company_name)
+        else:
+            company = company_from_filename(filename, companies)
+        year = entry.get("year") or default_year or year_from_filename(filename)
+
+        path = os.path.join(directory, filename)
+        if company is None:
+            plan.append((path, None, None, f"no company for {filename}; use --company or --mapping"))
+        elif year is None:
+            plan.append((path, None, None, f"no year for {filename}; use --year or --mapping"))
+        else:
+            plan.append((path, company, int(year), None))
+    return plan
+
+
+def print_report(results, wall_seconds):
+    print()
+    print(f"{'file':<60} {'status':<8} {'pages':>6} {'secs':>8} {'pages/s':>8} {'llm':>5} {'keys':>5}")
+    for r in results:
+        rate = r["pages"] / r["seconds"] if r["seconds"] else 0.0
+        print(f"{r['file'][:60]:<60} {r['status']:<8} {r['pages']:>6} {r['seconds']:>8.1f} {rate:>8.2f} {r['llm_calls']:>5} {r['keys_filled']:>5}")
+        if r.get("error"):
+            print(f"    error: {r['error']}")
+
+    processed = [r for r in results if r["status"] in ("done", "failed")]
+    total_pages = sum(r["pages"] for r in processed)
+    print()
+    print(f"{len(results)} files: {sum(r['status'] == 'done' for r in results)} done, "
+          f"{sum(r['status'] == 'skipped' for r in results)} skipped, {sum(r['status'] == 'failed' for r in results)} failed")
+    print(f"Wall time {wall_seconds:.1f}s, {total_pages} pages, "
+          f"{total_pages / wall_seconds if wall_seconds else 0.0:.2f} pages/s, "
+          f"{sum(r['llm_calls'] for r in processed)} LLM calls")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest a directory of annual report PDFs.")
+    parser.add_argument("directory", help="Directory containing PDF reports")
+    parser.add_argument("--company", help="Company name to use for every file not in the mapping")
+    parser.add_argument("--year", type=int, help="Financial year to use for every file not in the mapping")
+    parser.add_argument("--mapping", help="JSON file mapping file names to {company, year}")
+    parser.add_argument("--workers", type=int, default=2, help="Files processed at the same time (default 2)")
+    parser.add_argument("--pdf-workers", type=int, default=1, help="Processes used to parse each PDF (default 1)")
+    parser.add_argument("--force", action="store_true", help="Re-ingest files already marked done")
+    args = parser.parse_args(argv)
+
+    setup_database()
+    mapping = {}
+    if args.mapping:
+        with open(args.mapping) as f:
+            mapping = json.load(f)
+
+    plan = plan_jobs(args.directory, mapping, args.company, args.year)
+    results = []
+    for path, _, _, error in plan:
+        if error:
+            results.append({"file": os.path.basename(path), "status": "failed", "pages": 0, "llm_calls": 0,
+                            "keys_filled": 0, "seconds": 0.0, "error": error})
+
+    runnable = [(path, company, year) for path, company, year, error in plan if not error]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = [
+            executor.submit(ingest_document, path, company["id"], year, source="cli",
+                            pdf_workers=args.pdf_workers, force=args.force)
+            for path, company, year in runnable
+        ]
+        for future in futures:
+            result = future.result()
+            print(f"[{result['status']}] {result['file']} ({result['seconds']:.1f}s)")
+            results.append(result)
+
+    print_report(results, time.perf_counter() - started)
+    return 1 if any(r["status"] == "failed" for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
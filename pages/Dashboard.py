@@ -1,8 +1,14 @@
 import streamlit as st
-import pandas as pd
 from utils.auth import check_login, logout_button
-from utils.database import get_user_accessible_companies, get_company_financials
-from utils.llm_helper import get_initial_chat_messages, get_groq_response
+from utils.database import get_data_version, company_scope
+from utils.data_cache import (
+    cached_accessible_companies, cached_company_snapshot, cached_company_ratios, cached_group_rollup, cached_figure,
+    snapshot_long_frame, data_cache_stats,
+)
+from utils.group_rollup import group_members
+from utils.intent_router import router_stats
+from utils.llm_helper import get_initial_chat_messages, get_groq_response, streaming_preview
+from utils.telemetry import span
 
 # --- 1. PAGE SETUP ---
 st.set_page_config(page_title="AI Financial Analyst", page_icon="🤖", layout="wide")
@@ -19,15 +25,65 @@ st.divider()
 # --- 4. DATA LOADING AND SELECTION ---
 user_id = st.session_state["user_id"]
 role = st.session_state["role"]
-accessible_companies = get_user_accessible_companies(user_id, role)
+accessible_companies = cached_accessible_companies(user_id, role)
 
 if not accessible_companies:
     st.warning("You do not have access to any companies. Please contact an administrator.")
     st.stop()
 
+# Cache counters for this server process, useful when tuning the cache sizes.
+with st.sidebar.expander("Data cache"):
+    for stats in data_cache_stats():
+        st.caption(f"{stats['name']}: {stats['size']}/{stats['max_entries']} entries, "
+                   f"{stats['hit_rate']:.0%} hit rate, {stats['evictions']} evicted")
+    routing = router_stats()
+    st.caption(f"intent_router: {routing['routed']} of {routing['routed'] + routing['passed']} questions "
+               f"answered locally ({routing['hit_rate']:.0%})")
+
 # Create a dictionary for easy lookup of company names to IDs
 company_options = {c['name']: c['id'] for c in accessible_companies}
 
+# Groups are built from the companies this user can already see, so the
+# roll-up never includes a company outside their access.
+group_options = sorted({c['group_name'] for c in accessible_companies if c['group_name']})
+view_mode = "Single company"
+if group_options:
+    view_mode = st.radio("View", ["Single company", "Group roll-up"], horizontal=True)
+
+if view_mode == "Group roll-up":
+    selected_group = st.selectbox("Select a Group to Analyze", options=group_options, index=0)
+    members = group_members(accessible_companies, selected_group)
+    member_names = {c['id']: c['name'] for c in members}
+    with span("dashboard_load", view="group", group=selected_group):
+        rollup_df, group_ratio_df, members_df = cached_group_rollup(list(member_names))
+
+    if rollup_df is None:
+        st.error(f"No financial data found for any company in {selected_group}.")
+    else:
+        st.header(f"Group Snapshot: {selected_group}")
+        st.caption(f"Combined figures for {', '.join(member_names.values())}. "
+                   "Each year adds up the members that reported it; per-share metrics are left out.")
+        st.dataframe(rollup_df.style.format("{:,.2f}", na_rep="-"), use_container_width=True)
+
+        if not group_ratio_df.empty:
+            st.subheader("Key Ratios")
+            st.dataframe(group_ratio_df.style.format("{:,.2f}", na_rep="-"), use_container_width=True)
+
+        st.divider()
+        from utils.plotting import create_asset_liability_chart, create_stacked_bar_chart
+        rollup_long = snapshot_long_frame(rollup_df)
+        st.plotly_chart(create_asset_liability_chart(rollup_long), use_container_width=True)
+
+        contribution_metric = st.selectbox("Member contribution to", options=list(rollup_df.index))
+        contribution_df = members_df[members_df["metric"] == contribution_metric].assign(
+            company=lambda d: d["company_id"].map(member_names)
+        )
+        st.plotly_chart(
+            create_stacked_bar_chart(contribution_df, "year", "value", "company", f"{contribution_metric} by Company"),
+            use_container_width=True
+        )
+    st.stop()
+
 selected_company_name = st.selectbox(
     "Select a Company to Analyze",
     options=company_options.keys(),
@@ -38,22 +94,26 @@ selected_company_name = st.selectbox(
 if selected_company_name:
     selected_company_id = company_options[selected_company_name]
     
-    # Fetch financial data for the selected company
-    financial_records = get_company_financials(selected_company_id)
+    # Load the pre-pivoted snapshot (metric x year) and its text summary in one read.
+    # Ratios come from the shared ratio engine, computed across all companies at once.
+    with span("dashboard_load", view="company", company_id=selected_company_id):
+        # Read before the snapshot, so the summary is never older than the version it is filed under.
+        data_version = get_data_version(company_scope(selected_company_id))
+        snapshot_df, data_summary = cached_company_snapshot(selected_company_id)
+        if snapshot_df is not None:
+            ratio_df, ratio_summary = cached_company_ratios(selected_company_id)
     
-    if not financial_records:
+    if snapshot_df is None:
         st.error(f"No financial data found for {selected_company_name}. Please upload a financial report for this company first.")
     else:
-        # Convert data to a DataFrame for analysis and plotting
-        df = pd.DataFrame(financial_records, columns=['year', 'metric', 'value'])
-        
         # Display the main financial snapshot
         st.header(f"Financial Snapshot: {selected_company_name}")
-        
-        # Use a pivot table for a clean, year-by-year comparison
-        snapshot_df = df.pivot_table(index='metric', columns='year', values='value').sort_index()
         st.dataframe(snapshot_df.style.format("{:,.2f}", na_rep="-"), use_container_width=True)
 
+        if not ratio_df.empty:
+            st.subheader("Key Ratios")
+            st.dataframe(ratio_df.style.format("{:,.2f}", na_rep="-"), use_container_width=True)
+
         st.divider()
 
         # --- 6. CHAT INTERFACE ---
@@ -63,21 +123,26 @@ if selected_company_name:
         # It resets the chat if the user selects a new company.
         if "chat_history" not in st.session_state or st.session_state.get("company_id") != selected_company_id:
             st.info(f"Analyst is now focused on {selected_company_name}. Ask a question to begin.")
-            data_summary = snapshot_df.to_string()
             # Get the initial system prompt and message list from our helper
-            st.session_state.chat_history = get_initial_chat_messages(selected_company_name, data_summary)
+            st.session_state.chat_history = get_initial_chat_messages(selected_company_name, data_summary, ratio_summary)
             # This separate list stores messages for display purposes (without the long system prompt)
             st.session_state.messages_for_display = []
             st.session_state.company_id = selected_company_id
+            # Cached answers are keyed on the data this chat's system prompt describes.
+            st.session_state.chat_data_version = data_version
 
         # Display past chat messages
-        for message in st.session_state.messages_for_display:
+        for position, message in enumerate(st.session_state.messages_for_display):
             with st.chat_message(message["role"]):
                 # Handle messages that contain text, plots, or both
                 if "content" in message and message["content"]:
                     st.markdown(message["content"])
-                if "plot" in message and message["plot"]:
-                    st.plotly_chart(message["plot"], use_container_width=True)
+                if message.get("plot_request"):
+                    # Messages keep only the plot request; the figure comes from the shared memo
+                    figure = cached_figure(selected_company_id, message["plot_request"], lambda: snapshot_long_frame(snapshot_df))
+                    if figure is not None:
+                        # Keyed by position: a repeated answer draws an identical figure
+                        st.plotly_chart(figure, use_container_width=True, key=f"chat_plot_{position}")
 
         # React to user input
         if prompt := st.chat_input(f"Ask about {selected_company_name}'s performance..."):
@@ -88,28 +153,53 @@ if selected_company_name:
 
             # Get the AI's response
             with st.chat_message("assistant"):
-                with st.spinner("The AI Analyst is preparing your briefing..."):
-                    # Call the Groq helper function
-                    # It takes the full history and returns the response AND the updated history
-                    response_data, updated_history = get_groq_response(
-                        st.session_state.chat_history, 
-                        prompt, 
-                        df
-                    )
-                    
-                    # IMPORTANT: Update the full chat history in session state
-                    st.session_state.chat_history = updated_history
-                    
-                    # Prepare the bot's complete message (text + plot) for display
-                    bot_message_for_display = {"role": "assistant"}
-                    
-                    if "message" in response_data and response_data["message"]:
-                        st.markdown(response_data["message"])
-                        bot_message_for_display["content"] = response_data["message"]
-                    
-                    if "plot" in response_data and response_data["plot"]:
-                        st.plotly_chart(response_data["plot"], use_container_width=True)
-                        bot_message_for_display["plot"] = response_data["plot"]
-                    
-                    # Add the complete bot message to the display history
-                    st.session_state.messages_for_display.append(bot_message_for_display)
\ No newline at end of file
+                # Long-form rows (year, metric, value) for the plotting helpers
+                df = snapshot_long_frame(snapshot_df)
+
+                # The reply is streamed into this placeholder as it is generated
+                reply_placeholder = st.empty()
+                reply_placeholder.markdown("_The AI Analyst is preparing your briefing..._")
+
+                def show_partial_reply(text_so_far):
+                    preview = streaming_preview(text_so_far)
+                    if preview:
+                        reply_placeholder.markdown(preview + " ▌")
+
+                # Call the Groq helper function
+                # It takes the full history and returns the response AND the updated history
+                response_data, updated_history = get_groq_response(
+                    st.session_state.chat_history, 
+                    prompt, 
+                    df,
+                    on_token=show_partial_reply,
+                    company_id=selected_company_id,
+                    data_version=st.session_state.get("chat_data_version")
+                )
+                
+                # IMPORTANT: Update the full chat history in session state
+                st.session_state.chat_history = updated_history
+                
+                # Prepare the bot's complete message (text + plot) for display
+                bot_message_for_display = {"role": "assistant"}
+                
+                if "message" in response_data and response_data["message"]:
+                    reply_placeholder.markdown(response_data["message"])
+                    bot_message_for_display["content"] = response_data["message"]
+                else:
+                    reply_placeholder.empty()
+                
+                if "plot" in response_data and response_data["plot"]:
+                    st.plotly_chart(response_data["plot"], use_container_width=True,
+                                    key=f"chat_plot_{len(st.session_state.messages_for_display)}")
+                    bot_message_for_display["plot_request"] = response_data["plot_request"]
+
+                if response_data.get("routed"):
+                    st.caption("Answered locally from the data")
+                elif response_data.get("cached"):
+                    st.caption("Answered from the cache for the current data")
+                elif response_data.get("ttft_seconds") is not None:
+                    st.caption(f"First token in {response_data['ttft_seconds']:.2f}s, "
+                               f"complete in {response_data['total_seconds']:.2f}s")
+                
+                # Add the complete bot message to the display history
+                st.session_state.messages_for_display.append(bot_message_for_display)
@@ -0,0 +1,94 @@
+# pages/pipeline_metrics.py
+import streamlit as st
+from datetime import datetime
+from utils.auth import check_login, logout_button
+from utils.telemetry import stage_summary, get_recent_spans, prometheus_text, STAGES
+from utils.groq_gateway import gateway_stats
+
+# Rolling windows offered on the page, in seconds.
+WINDOWS = {"Last 15 minutes": 15 * 60, "Last hour": 3600, "Last 24 hours": 24 * 3600, "Last 7 days": 7 * 24 * 3600}
+
+# --- PAGE SETUP & AUTHENTICATION ---
+st.set_page_config(page_title="Pipeline Metrics", page_icon="⏱️", layout="wide")
+check_login()
+logout_button()
+
+if st.session_state['role'] != 'analyst':
+    st.error("🔒 Access Denied")
+    st.warning("You do not have permission to view this page. Please log in as an Analyst.")
+    st.stop()
+
+st.title("⏱️ Pipeline Metrics")
+st.write("Timing spans recorded by report ingestion, the dashboard and the chat, across every server and batch process.")
+
+window_label = st.selectbox("Window", options=list(WINDOWS), index=1)
+window_seconds = WINDOWS[window_label]
+
+# --- ROLLING PERCENTILES PER STAGE ---
+summary = stage_summary(window_seconds)
+if not summary:
+    st.info("No spans recorded in this window yet.")
+else:
+    st.subheader("Stages")
+    st.dataframe(
+        [{
+            "Stage": entry["stage"],
+            "Spans": entry["count"],
+            "Errors": entry["errors"],
+            "p50 (s)": round(entry["p50_seconds"], 3),
+            "p95 (s)": round(entry["p95_seconds"], 3),
+            "p99 (s)": round(entry["p99_seconds"], 3),
+            "Total (s)": round(entry["total_seconds"], 1),
+            "Prompt tokens": entry["prompt_tokens"],
+            "Completion tokens": entry["completion_tokens"],
+            "Retries": entry["retries"],
+        } for entry in summary],
+        use_container_width=True, hide_index=True
+    )
+
+    st.subheader("Recent spans")
+    stage_filter = st.selectbox("Stage", options=["All", *STAGES])
+    recent = get_recent_spans(limit=50, stage=None if stage_filter == "All" else stage_filter)
+    st.dataframe(
+        [{
+            "Started": datetime.fromtimestamp(item["started_at"]).strftime("%Y-%m-%d %H:%M:%S"),
+            "Stage": item["stage"],
+            "Seconds": round(item["seconds"], 3),
+            "Status": item["status"],
+            "Prompt tokens": item["prompt_tokens"],
+            "Completion tokens": item["completion_tokens"],
+            "Retries": item["retries"],
+            "Details": ", ".join(f"{key}={value}" for key, value in item["attrs"].items()),
+        } for item in recent],
+        use_container_width=True, hide_index=True
+    )
+
+# --- GROQ RATE LIMITING (this server process only) ---
+gateways = gateway_stats()
+if gateways:
+    st.subheader("Groq gateway")
+    st.caption("Live limits and counters of this server process since it started.")
+    st.dataframe(
+        [{
+            "Model": gate["model"],
+            "Concurrency limit": gate["concurrency_limit"],
+            "In flight": gate["in_flight"],
+            "Waiting (chat)": gate["waiting_chat"],
+            "Waiting (ingest)": gate["waiting_ingest"],
+            "Tokens available": f'{gate["tokens_available"]} / {gate["tokens_per_minute"]}',
+            "Paused (s)": gate["paused_seconds"],
+            "Requests": gate["requests"],
+            "Throttled": gate["throttled"],
+            "Retries": gate["retries"],
+            "Failures": gate["failures"],
+            "Cancelled": gate["cancelled"],
+        } for gate in gateways],
+        use_container_width=True, hide_index=True
+    )
+
+# --- PROMETHEUS EXPORT ---
+with st.expander("Prometheus text"):
+    st.caption("For a scrape endpoint, run `python -m utils.telemetry --serve 9464`.")
+    text = prometheus_text(window_seconds)
+    st.code(text, language="text")
+    st.download_button("Download", text, file_name="pipeline_metrics.prom", mime="text/plain")
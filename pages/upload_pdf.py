@@ -1,10 +1,14 @@
 # pages/2_📤_Upload_Report.py
 import streamlit as st
 import os
+import time
+import uuid
 from utils.auth import check_login, logout_button
-from utils.database import get_all_companies, save_financial_data
-from utils.llm_helper import process_pdf_pages,process_pdf_pages
-from utils.pdf_processor import extract_pages_from_pdf
+from utils.database import get_all_companies, get_recent_ingest_jobs
+from utils.llm_helper import REQUIRED_KEYS
+from utils.job_queue import submit_ingest_job
+
+UPLOAD_DIR = os.path.join("data", "uploads")
 
 # --- PAGE SETUP & AUTHENTICATION ---
 st.set_page_config(page_title="Upload Report", page_icon="📤", layout="wide")
@@ -35,36 +39,44 @@ with st.form("upload_form", clear_on_submit=True):
 
 if submitted and uploaded_file is not None and year and selected_company_name:
     company_id = company_options[selected_company_name]
-    
-    with st.spinner(f"Processing '{uploaded_file.name}' for {year}... This may take several minutes."):
-        save_path = os.path.join("data", uploaded_file.name)
-        with open(save_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
 
-        # 1. Extract text page by page
-        st.info("Step 1: Extracting text from PDF (page by page)...")
-        pages = extract_pages_from_pdf(save_path)
+    # Every upload gets its own file, so re-uploading a report never
+    # overwrites the copy a queued or running job is reading. The worker
+    # deletes it when done.
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    save_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{company_id}_{year}_{os.path.basename(uploaded_file.name)}")
+    with open(save_path, "wb") as f:
+        f.write(uploaded_file.getbuffer())
+
+    job_id = submit_ingest_job(save_path, company_id, year, uploaded_file.name, submitted_by=st.session_state["username"])
+    st.success(f"Queued '{uploaded_file.name}' for {selected_company_name} ({year}) as job #{job_id}. "
+               "You can keep working or leave this page; progress is shown below.")
 
-        if not pages:
-            st.error("Failed to extract any text from the PDF. The document might be scanned, encrypted or corrupted.")
-            os.remove(save_path)
-            st.stop()
-        
-        st.success(f"Text extraction complete. Found {len(pages)} pages with text.")
+# --- JOB PROGRESS ---
+# The fragment re-runs on its own every few seconds, so progress updates
+# without blocking the page or re-running the upload form.
+@st.fragment(run_every=2)
+def show_jobs():
+    st.subheader("Your Ingestion Jobs")
+    jobs = get_recent_ingest_jobs(submitted_by=st.session_state["username"])
+    if not jobs:
+        st.caption("No reports queued yet.")
+        return
 
-        # 2. Analyze pages with AI
-        st.info("Step 2: Analyzing pages with AI to extract financial data...")
-        # --- USE THE NEW FUNCTION ---
-        financial_data = process_pdf_pages(pages, year) 
+    for job in jobs:
+        label = f"#{job['id']} · {job['source_document']} · {job['company_name']} {job['year']}"
+        keys_filled = job['keys_filled'] or 0
+        with st.container(border=True):
+            st.markdown(f"**{label}** — `{job['status']}`")
+            if job['status'] in ('queued', 'running'):
+                st.progress(keys_filled / len(REQUIRED_KEYS),
+                            text=f"{job['pages_done'] or 0} pages read · {job['llm_calls'] or 0} LLM calls · "
+                                 f"{keys_filled}/{len(REQUIRED_KEYS)} metrics found")
+            elif job['status'] == 'done':
+                elapsed = (job['finished_at'] or 0) - (job['started_at'] or 0)
+                st.caption(f"Saved {keys_filled}/{len(REQUIRED_KEYS)} metrics from {job['pages_total'] or 0} pages "
+                           f"with {job['llm_calls'] or 0} LLM calls in {elapsed:.0f}s. Finished {time.ctime(job['finished_at'])}.")
+            elif job['status'] == 'failed':
+                st.error(f"AI Analysis Failed: {job['error']}")
 
-        os.remove(save_path)
-        
-        if "error" in financial_data:
-            st.error(f"AI Analysis Failed: {financial_data['error']}")
-        else:
-            st.info("Step 3: Saving extracted data to the database...")
-            save_financial_data(company_id, year, financial_data, uploaded_file.name)
-            st.success(f"Successfully processed and saved data for {selected_company_name} for {year}.")
-            st.balloons()
-            st.subheader("Extracted Data:")
-            st.json(financial_data)
\ No newline at end of file
+show_jobs()
@@ -0,0 +1,71 @@
+# utils/answer_cache.py
+import re
+from utils.cache import LRUCache
+from utils.database import get_data_version, company_scope
+
+# Answers to repeated analyst questions ("show revenue growth"), keyed by
+# company, the data version the conversation's prompt was built from and the
+# normalized question. Only
+# questions that do not lean on earlier turns are cached, and the stored
+# plot request lets the chart be rebuilt locally without a model call.
+
+ANSWER_CACHE_SIZE = 512
+ANSWER_TTL_SECONDS = 24 * 3600
+
+# Words that usually point back at an earlier turn ("what about that?").
+CONTEXT_WORDS = {
+    "it", "its", "that", "this", "these", "those", "them", "they", "there", "same", "again",
+    "previous", "above", "earlier", "also", "too", "more", "else", "instead", "why",
+}
+_FILLER_PREFIX = re.compile(r"^(?:please |can you |could you |would you |kindly )+")
+
+answer_cache = LRUCache("answers", max_entries=ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_TTL_SECONDS)
+
+
+def normalize_question(prompt):
+    """Lowercases, strips punctuation and polite prefixes, and collapses whitespace."""
+    text = re.sub(r"[^\w\s%]", " ", prompt.lower())
+    text = " ".join(text.split())
+    return _FILLER_PREFIX.sub("", text).strip()
+
+
+def is_cacheable_question(chat_history, prompt):
+    """
+    True for the first question of a conversation, or for a later one that
+    does not refer back to earlier turns.
+    """
+    if not any(message["role"] == "user" for message in chat_history):
+        return True
+    return not (set(normalize_question(prompt).split()) & CONTEXT_WORDS)
+
+
+def _key(company_id, prompt, data_version):
+    if data_version is None:
+        data_version = get_data_version(company_scope(company_id))
+    return (company_id, data_version, normalize_question(prompt))
+
+
+def get_cached_answer(company_id, prompt, data_version=None):
+    """
+    Returns the cached {"response_text", "message", "plot_request"} for this
+    question against data_version of the company's data (default: the
+    current one), or None. Pass the version the chat's system prompt was
+    built from, so a conversation started before a new report was saved is
+    not mixed up with answers from the new data.
+    """
+    key = _key(company_id, prompt, data_version)
+    entry = answer_cache.get(key)
+    if entry is None:
+        # Answers computed from an older version of this company's data are stale.
+        answer_cache.discard(lambda k: k[0] == company_id and k[1] < key[1])
+    return entry
+
+
+def store_answer(company_id, prompt, response_text, message, plot_request, data_version=None):
+    """Caches an answer under data_version (see get_cached_answer)."""
+    answer_cache.set(_key(company_id, prompt, data_version),
+                     {"response_text": response_text, "message": message, "plot_request": plot_request})
+
+
+def answer_cache_stats():
+    return answer_cache.stats()
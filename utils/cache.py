@@ -0,0 +1,76 @@
+# utils/cache.py
+import threading
+import time
+from collections import OrderedDict
+
+# Small in-process LRU cache with optional TTL and hit/miss/eviction counters.
+# Entries are keyed on the data version they were built from, so a write never
+# has to find and delete them: the next read simply asks for a new key and the
+# stale entry ages out of the LRU order.
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, name, max_entries=128, ttl_seconds=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()   # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key, default=None):
+        """Returns the cached value for key, or default on a miss or expiry."""
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and self.ttl_seconds is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self._stats["expired"] += 1
+                entry = _MISSING
+            if entry is _MISSING:
+                self._stats["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get_or_load(self, key, loader):
+        """Read-through lookup: calls loader() on a miss and caches its result."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def discard(self, predicate):
+        """Drops every entry whose key matches predicate; returns how many."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+            self._stats["evictions"] += len(keys)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns size, capacity, counters and hit rate for this cache."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["name"] = self.name
+        stats["max_entries"] = self.max_entries
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
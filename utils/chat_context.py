@@ -0,0 +1,132 @@
+# utils/chat_context.py
+import json
+import re
+from utils.page_packer import estimate_text_tokens
+from utils.statement_parser import UNSCALED_KEYS, AMOUNT_UNIT, PER_SHARE_UNIT
+
+# Keeps what is sent to the chat model inside its context window. The system
+# prompt (with the data tables) is always sent, then as many of the most
+# recent turns as fit; older turns are folded into a short summary note.
+
+CHAT_MODEL = "llama3-8b-8192"
+CONTEXT_WINDOW_TOKENS = 8192
+# Room left for the model's answer; also passed as max_tokens.
+RESPONSE_RESERVE_TOKENS = 1024
+# Upper bound for the note that stands in for dropped turns.
+SUMMARY_BUDGET_TOKENS = 300
+# Rough per-message overhead of the chat format (role markers etc.).
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_SNIPPET_CHARS = 160
+
+# Unit column for amounts saved before they were normalized to crore.
+UNRECORDED_UNIT = "unit not recorded"
+
+
+def estimate_tokens(text):
+    """
+    Token estimate for a prompt. The data tables are mostly digits and
+    commas, which a flat characters-per-token rate undercounts badly, so
+    this uses the same piece count as the extraction windows.
+    """
+    return estimate_text_tokens(text)
+
+
+def message_tokens(message):
+    return estimate_tokens(message.get("content")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _format_number(value, significant_digits=None):
+    """The value in plain positional notation, at full precision unless significant_digits is given."""
+    import numpy as np
+    if value != value:
+        return ""
+    if significant_digits is None:
+        return np.format_float_positional(value, trim="-")
+    return np.format_float_positional(value, precision=significant_digits, unique=False, fractional=False, trim="-")
+
+
+def encode_frame_csv(frame, with_units=True, significant_digits=None, unrecorded=()):
+    """
+    Encodes a metric x year frame as CSV for a prompt. With with_units, a
+    'unit' column names each row's absolute unit (amounts are stored in
+    AMOUNT_UNIT, per-share rows in PER_SHARE_UNIT). Amounts in unrecorded
+    (metric, year) cells were saved before that normalization; they go on
+    a row of their own marked UNRECORDED_UNIT rather than being claimed as
+    crore. Values keep full precision unless significant_digits is given;
+    missing cells are left empty.
+    """
+    import numpy as np
+    years = [str(year) for year in frame.columns]
+    values = frame.to_numpy(dtype=float)
+    lines = [",".join([frame.index.name or "metric"] + (["unit"] if with_units else []) + years)]
+    for label, row in zip(frame.index, values):
+        name = str(label).replace(",", " ")
+        if not with_units:
+            lines.append(",".join([name] + [_format_number(value, significant_digits) for value in row]))
+            continue
+        if label in UNSCALED_KEYS:
+            lines.append(",".join([name, PER_SHARE_UNIT] + [_format_number(value, significant_digits) for value in row]))
+            continue
+        legacy = np.array([(label, year) in unrecorded for year in frame.columns], dtype=bool)
+        parts = [(unit, np.where(keep, row, np.nan)) for unit, keep in ((AMOUNT_UNIT, ~legacy), (UNRECORDED_UNIT, legacy))]
+        parts = [(unit, part) for unit, part in parts if not np.isnan(part).all()] or [(AMOUNT_UNIT, row)]
+        for unit, part in parts:
+            lines.append(",".join([name, unit] + [_format_number(value, significant_digits) for value in part]))
+    return "\n".join(lines)
+
+
+def _snippet(message):
+    """First sentence of a turn, using the 'message' field of JSON plot replies."""
+    content = message.get("content") or ""
+    if "plot_request" in content:
+        match = re.search(r"\{.*\}", content, re.DOTALL)
+        if match:
+            try:
+                content = json.loads(match.group(0)).get("message") or content
+            except (ValueError, AttributeError):
+                pass
+    content = " ".join(content.split())
+    sentence = re.split(r"(?<=[.!?])\s", content, maxsplit=1)[0]
+    return sentence[:SUMMARY_SNIPPET_CHARS]
+
+
+def _summary_message(dropped):
+    """A system note listing the gist of dropped turns; the oldest go first if over budget."""
+    lines = [f"{'User' if m['role'] == 'user' else 'Analyst'}: {_snippet(m)}" for m in dropped]
+    header = "Summary of earlier conversation (older turns omitted):"
+    while lines and estimate_tokens(header + "\n" + "\n".join(lines)) > SUMMARY_BUDGET_TOKENS:
+        lines.pop(0)
+    if not lines:
+        return None
+    return {"role": "system", "content": header + "\n" + "\n".join(lines)}
+
+
+def compact_history(chat_history, budget=CONTEXT_WINDOW_TOKENS - RESPONSE_RESERVE_TOKENS):
+    """
+    Returns the messages to send for chat_history: the leading system
+    prompt, a summary of any turns that did not fit, and the most recent
+    turns within the token budget. The latest message is always kept.
+    chat_history itself is left unchanged.
+    """
+    if not chat_history:
+        return []
+    head = [chat_history[0]] if chat_history[0]["role"] == "system" else []
+    turns = chat_history[len(head):]
+
+    remaining = budget - sum(message_tokens(m) for m in head) - SUMMARY_BUDGET_TOKENS
+    kept = []
+    for message in reversed(turns):
+        cost = message_tokens(message)
+        if kept and cost > remaining:
+            break
+        kept.append(message)
+        remaining -= cost
+    kept.reverse()
+
+    # Never start the kept window on an assistant reply without its question.
+    dropped = turns[:len(turns) - len(kept)]
+    while len(kept) > 1 and kept[0]["role"] == "assistant":
+        dropped.append(kept.pop(0))
+
+    summary = _summary_message(dropped) if dropped else None
+    return head + ([summary] if summary else []) + kept
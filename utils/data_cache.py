@@ -0,0 +1,116 @@
+# utils/data_cache.py
+from utils.cache import LRUCache
+from utils.database import (
+    get_user_accessible_companies, get_company_snapshot, get_data_versions, company_scope,
+    FINANCIALS_SCOPE,
+)
+from utils.ratios import build_ratio_table, company_ratio_frame, snapshot_ratio_frame, format_ratio_summary
+from utils.group_rollup import build_group_rollup
+from utils.answer_cache import answer_cache_stats
+from utils.chat_context import encode_frame_csv
+
+# Process-wide read-through caches for the Dashboard. Streamlit reruns the page
+# on every interaction (each chat message included); with these in front of
+# the database a rerun costs one primary-key read of the data versions.
+
+COMPANY_LIST_CACHE_SIZE = 64
+SNAPSHOT_CACHE_SIZE = 128
+# The ratio table covers every company, so one entry per data version is enough.
+RATIO_CACHE_SIZE = 2
+GROUP_CACHE_SIZE = 32
+FIGURE_CACHE_SIZE = 256
+
+company_list_cache = LRUCache("company_lists", max_entries=COMPANY_LIST_CACHE_SIZE)
+snapshot_cache = LRUCache("company_snapshots", max_entries=SNAPSHOT_CACHE_SIZE)
+ratio_cache = LRUCache("ratio_tables", max_entries=RATIO_CACHE_SIZE)
+group_cache = LRUCache("group_rollups", max_entries=GROUP_CACHE_SIZE)
+figure_cache = LRUCache("figures", max_entries=FIGURE_CACHE_SIZE)
+
+
+def _drop_older_versions(cache, company_id, version):
+    """Evicts entries for company_id built from an older data version."""
+    return cache.discard(lambda key: key[0] == company_id and key[1] != version)
+
+
+def cached_accessible_companies(user_id, role):
+    """get_user_accessible_companies, cached until the company catalog changes."""
+    version = get_data_versions(["catalog"])["catalog"]
+    return company_list_cache.get_or_load(
+        (user_id, role, version), lambda: list(get_user_accessible_companies(user_id, role))
+    )
+
+
+def cached_company_snapshot(company_id):
+    """
+    get_company_snapshot plus its CSV rendering for the chat prompt, cached
+    per (company_id, data version). Returns (snapshot_df, summary), both
+    None without data; treat the frame as read-only, it is shared.
+    """
+    version = get_data_versions([company_scope(company_id)])[company_scope(company_id)]
+    key = (company_id, version)
+    snapshot = snapshot_cache.get(key)
+    if snapshot is None:
+        _drop_older_versions(snapshot_cache, company_id, version)
+        snapshot_df, unrecorded = get_company_snapshot(company_id)
+        snapshot = (snapshot_df, encode_frame_csv(snapshot_df, unrecorded=unrecorded) if snapshot_df is not None else None)
+        snapshot_cache.set(key, snapshot)
+    return snapshot
+
+
+def cached_ratio_table():
+    """build_ratio_table for all companies, rebuilt only when any financials change."""
+    version = get_data_versions([FINANCIALS_SCOPE])[FINANCIALS_SCOPE]
+    return ratio_cache.get_or_load(version, build_ratio_table)
+
+
+def cached_company_ratios(company_id):
+    """Returns (ratio_df, summary) for one company from the cached ratio table."""
+    ratio_df = company_ratio_frame(cached_ratio_table(), company_id)
+    return ratio_df, format_ratio_summary(ratio_df)
+
+
+def cached_group_rollup(company_ids):
+    """
+    build_group_rollup plus the roll-up's ratios, cached on the member set
+    and every member's data version. Returns (rollup_df, ratio_df,
+    members_df), all None when no member has data.
+    """
+    company_ids = tuple(sorted(company_ids))
+    versions = get_data_versions([company_scope(company_id) for company_id in company_ids])
+    key = (company_ids, tuple(versions[company_scope(company_id)] for company_id in company_ids))
+
+    def load():
+        rollup_df, members_df = build_group_rollup(company_ids)
+        ratio_df = snapshot_ratio_frame(rollup_df) if rollup_df is not None else None
+        return rollup_df, ratio_df, members_df
+
+    return group_cache.get_or_load(key, load)
+
+
+def snapshot_long_frame(snapshot_df):
+    """Long-form year/metric/value rows from a metric x year snapshot, for the plotting helpers."""
+    return snapshot_df.rename_axis(columns="year").stack().dropna().rename("value").reset_index()[["year", "metric", "value"]]
+
+
+def cached_figure(company_id, plot_request, load_df):
+    """
+    build_plot_figure memoized per (company_id, data version, plot type,
+    metric, title). load_df is only called on a miss. The figure is shared
+    between sessions, so callers must not modify it.
+    """
+    version = get_data_versions([company_scope(company_id)])[company_scope(company_id)]
+    key = (company_id, version, plot_request.get("type"), plot_request.get("metric"), plot_request.get("title"))
+    figure = figure_cache.get(key)
+    if figure is None:
+        from utils.plotting import build_plot_figure  # plotly loads on the first chart
+        _drop_older_versions(figure_cache, company_id, version)
+        figure = build_plot_figure(plot_request, load_df())
+        if figure is not None:
+            figure_cache.set(key, figure)
+    return figure
+
+
+def data_cache_stats():
+    """Size, hit rate and eviction counters for each Dashboard cache, the answer cache included."""
+    return [company_list_cache.stats(), snapshot_cache.stats(), ratio_cache.stats(),
+            group_cache.stats(), figure_cache.stats(), answer_cache_stats()]
@@ -1,44 +1,256 @@
 # utils/database.py
+import json
+import queue
 import sqlite3
+import threading
+import time
+import weakref
+
+# pandas is imported inside the functions that need it, so pages that only
+# log in or list companies start without loading it.
 
 DB_NAME = "data/financial_data.db"
 
+# Streamlit reruns every page script on each interaction, each time on a new
+# ScriptRunner thread, and the ingest workers run on their own threads.
+# Rather than opening a new connection per helper call, a thread borrows one
+# persistent, tuned connection on first use and keeps it for its lifetime;
+# when the thread ends the connection goes back to a small pool per database,
+# so the next rerun picks it up instead of reconnecting and rerunning PRAGMAs.
+_local = threading.local()
+_pools = {}               # DB_NAME -> queue.Queue of idle connections
+_pools_lock = threading.Lock()
+
+# Idle connections kept per database; more are opened (and later closed) under load.
+POOL_SIZE = 8
+# Statements kept compiled per connection; the helpers below reuse a small set.
+CACHED_STATEMENTS = 256
+PRAGMAS = [
+    "PRAGMA journal_mode=WAL",      # readers never block the ingest writer
+    "PRAGMA synchronous=NORMAL",    # safe with WAL, far fewer fsyncs
+    "PRAGMA cache_size=-32000",     # ~32 MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+]
+
+def _pool(db_name):
+    with _pools_lock:
+        if db_name not in _pools:
+            _pools[db_name] = queue.Queue(maxsize=POOL_SIZE)
+        return _pools[db_name]
+
+def _return_to_pool(db_name, conn):
+    """Runs when the borrowing thread ends: keeps the connection for the next thread, or closes it."""
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        _pool(db_name).put_nowait(conn)
+    except (queue.Full, sqlite3.Error):
+        conn.close()
+
+class _Lease:
+    """Held in the borrowing thread's locals; collected (returning the connection) when the thread ends."""
+
+    def __init__(self, db_name, conn):
+        self.db_name = db_name
+        self.conn = conn
+        self._finalizer = weakref.finalize(self, _return_to_pool, db_name, conn)
+
+    def detach(self):
+        self._finalizer.detach()
+
 def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False) # check_same_thread for Streamlit
-    conn.row_factory = sqlite3.Row
+    """
+    Returns this thread's persistent connection to the SQLite database,
+    taking an idle one from the pool or opening and tuning a new one on
+    first use. Callers must not close it, and should write inside
+    `with conn:` so a failure rolls back instead of leaving the shared
+    connection mid-transaction.
+    """
+    lease = getattr(_local, "lease", None)
+    if lease is not None and lease.db_name == DB_NAME:
+        return lease.conn
+
+    try:
+        conn = _pool(DB_NAME).get_nowait()
+    except queue.Empty:
+        conn = sqlite3.connect(DB_NAME, check_same_thread=False, cached_statements=CACHED_STATEMENTS) # check_same_thread for Streamlit
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+    # A thread that switches databases hands its old connection back first.
+    _local.lease = _Lease(DB_NAME, conn)
     return conn
 
+def close_db_connection():
+    """Closes this thread's connection instead of returning it to the pool."""
+    lease = getattr(_local, "lease", None)
+    if lease is not None:
+        lease.detach()
+        lease.conn.close()
+        _local.lease = None
+
+# --- SCHEMA ---
+# financial_data is clustered on (company_id, year, metric_id): the primary key
+# doubles as the covering index for per-company reads, and rows carry a small
+# integer instead of the metric name.
+FINANCIAL_DATA_DDL = """
+    CREATE TABLE {table} (
+        company_id INTEGER NOT NULL REFERENCES companies(id),
+        year INTEGER NOT NULL,
+        metric_id INTEGER NOT NULL REFERENCES metrics(id),
+        value REAL,
+        source_document TEXT,
+        in_crore INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (company_id, year, metric_id)
+    ) WITHOUT ROWID
+"""
+FINANCIAL_DATA_INDEXES = [
+    # Metric-first and year-range scans across companies. company_id comes
+    # along with the primary key, so this index covers those queries.
+    "CREATE INDEX IF NOT EXISTS idx_financial_data_metric_year ON financial_data (metric_id, year, value)",
+]
+COMPANY_SNAPSHOTS_DDL = "CREATE TABLE {table} (company_id INTEGER PRIMARY KEY, frame TEXT NOT NULL, updated_at REAL)"
+SCHEMA_VERSION = 5
+
+def _table_exists(cursor, name):
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+def _migrate_schema(cursor):
+    """
+    Brings an existing database up to SCHEMA_VERSION. Version 1 moves
+    financial_data from free-text metric names to metric ids; versions 2
+    and 3 (re)build the company_snapshots rows and their prompt summaries,
+    version 4 drops those summaries again (the chat renders its own), and
+    version 5 adds financial_data.in_crore, left 0 on rows saved before
+    amounts were normalized to crore, since their unit was never recorded.
+    """
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    if version < 1:
+        _migrate_metric_ids(cursor)
+    if version < 4:
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(company_snapshots)")]
+        if "summary" in columns:
+            # Rebuilt rather than ALTER ... DROP COLUMN, which older SQLite builds lack.
+            cursor.execute("DROP TABLE IF EXISTS company_snapshots_v4")
+            cursor.execute(COMPANY_SNAPSHOTS_DDL.format(table="company_snapshots_v4"))
+            cursor.execute("INSERT INTO company_snapshots_v4 (company_id, frame, updated_at) SELECT company_id, frame, updated_at FROM company_snapshots")
+            cursor.execute("DROP TABLE company_snapshots")
+            cursor.execute("ALTER TABLE company_snapshots_v4 RENAME TO company_snapshots")
+    if version < 5:
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(financial_data)")]
+        if "in_crore" not in columns:
+            cursor.execute("ALTER TABLE financial_data ADD COLUMN in_crore INTEGER NOT NULL DEFAULT 0")
+        # Version 2 built the snapshots; version 5 rebuilds them with the cells of unrecorded unit.
+        company_ids = [row[0] for row in cursor.execute("SELECT DISTINCT company_id FROM financial_data")]
+        for company_id in company_ids:
+            _rebuild_company_snapshot(cursor, company_id)
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+def _migrate_metric_ids(cursor):
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(financial_data)")]
+    if "metric" in columns:
+        print("Migrating financial_data to the metric dictionary layout...")
+        cursor.execute("INSERT OR IGNORE INTO metrics (name) SELECT DISTINCT metric FROM financial_data WHERE metric IS NOT NULL")
+        cursor.execute("DROP TABLE IF EXISTS financial_data_v1")
+        cursor.execute(FINANCIAL_DATA_DDL.format(table="financial_data_v1"))
+        cursor.execute("""
+            INSERT OR REPLACE INTO financial_data_v1 (company_id, year, metric_id, value, source_document)
+            SELECT f.company_id, f.year, m.id, f.value, f.source_document
+            FROM financial_data f JOIN metrics m ON m.name = f.metric
+            WHERE f.company_id IS NOT NULL AND f.year IS NOT NULL
+            ORDER BY f.id
+        """)
+        cursor.execute("DROP TABLE financial_data")
+        cursor.execute("ALTER TABLE financial_data_v1 RENAME TO financial_data")
+
+    for statement in FINANCIAL_DATA_INDEXES:
+        cursor.execute(statement)
+
+_schema_ready = set()   # DB_NAME values already set up by this process
+_schema_lock = threading.Lock()
+
 def setup_database():
-    """Creates the necessary tables if they don't exist and populates initial data."""
+    """
+    Creates the necessary tables if they don't exist and populates initial
+    data. Runs once per process and database; later calls return at once.
+    """
+    with _schema_lock:
+        if DB_NAME in _schema_ready:
+            return
+        _setup_schema()
+        _schema_ready.add(DB_NAME)
+
+def _setup_schema():
     conn = get_db_connection()
-    cursor = conn.cursor()
+    with conn:
+        cursor = conn.cursor()
+
+        cursor.execute("CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT UNIQUE, password TEXT, role TEXT)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS companies (id INTEGER PRIMARY KEY, name TEXT UNIQUE, group_name TEXT)")
+        cursor.execute("CREATE TABLE IF NOT EXISTS user_company_access (user_id INTEGER, company_id INTEGER, PRIMARY KEY (user_id, company_id))")
+        # Metric names are stored once in a dictionary table and referenced by id.
+        cursor.execute("CREATE TABLE IF NOT EXISTS metrics (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)")
+        if not _table_exists(cursor, "financial_data"):
+            cursor.execute(FINANCIAL_DATA_DDL.format(table="financial_data"))
+        # Pre-pivoted metric x year table per company, kept current by save_financial_data_bulk.
+        if not _table_exists(cursor, "company_snapshots"):
+            cursor.execute(COMPANY_SNAPSHOTS_DDL.format(table="company_snapshots"))
+        _migrate_schema(cursor)
+        # Ledger of ingestion jobs. A document is identified by its content hash, so
+        # a re-run skips files that already finished for the same company and year.
+        # One counter per data scope ('company:<id>', 'financials', 'catalog'), bumped by every write
+        # so caches in any process can tell their copy is out of date.
+        cursor.execute("CREATE TABLE IF NOT EXISTS data_versions (scope TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID")
+        cursor.execute("CREATE TABLE IF NOT EXISTS ingest_jobs (id INTEGER PRIMARY KEY, file_path TEXT, source_document TEXT, file_hash TEXT, company_id INTEGER, year INTEGER, source TEXT, submitted_by TEXT, status TEXT, pages_done INTEGER DEFAULT 0, pages_total INTEGER, llm_calls INTEGER DEFAULT 0, keys_filled INTEGER DEFAULT 0, error TEXT, created_at REAL, started_at REAL, finished_at REAL, UNIQUE(file_hash, company_id, year))")
+
+        # --- POPULATE INITIAL DATA (if tables are empty) ---
+        if cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
+            cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", ('analyst', 'password123', 'analyst'))
+            cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", ('jio_ceo', 'password123', 'ceo'))
+            cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", ('ambani', 'password123', 'top_management'))
+
+        if cursor.execute("SELECT COUNT(*) FROM companies").fetchone()[0] == 0:
+            cursor.execute("INSERT INTO companies (name, group_name) VALUES (?, ?)", ('Reliance Jio', 'Reliance'))
+            cursor.execute("INSERT INTO companies (name, group_name) VALUES (?, ?)", ('Reliance Retail', 'Reliance'))
 
-    cursor.execute("CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, username TEXT UNIQUE, password TEXT, role TEXT)")
-    cursor.execute("CREATE TABLE IF NOT EXISTS companies (id INTEGER PRIMARY KEY, name TEXT UNIQUE, group_name TEXT)")
-    cursor.execute("CREATE TABLE IF NOT EXISTS user_company_access (user_id INTEGER, company_id INTEGER, PRIMARY KEY (user_id, company_id))")
-    cursor.execute("CREATE TABLE IF NOT EXISTS financial_data (id INTEGER PRIMARY KEY, company_id INTEGER, year INTEGER, metric TEXT, value REAL, source_document TEXT, UNIQUE(company_id, year, metric))")
+        if cursor.execute("SELECT COUNT(*) FROM user_company_access").fetchone()[0] == 0:
+            cursor.execute("INSERT INTO user_company_access (user_id, company_id) VALUES ((SELECT id FROM users WHERE username='jio_ceo'), (SELECT id FROM companies WHERE name='Reliance Jio'))")
+            bump_data_versions(conn, ["catalog"])
 
-    # --- POPULATE INITIAL DATA (if tables are empty) ---
-    if cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
-        cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", ('analyst', 'password123', 'analyst'))
-        cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", ('jio_ceo', 'password123', 'ceo'))
-        cursor.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)", ('ambani', 'password123', 'top_management'))
+# Bumped on any financial_data write, for caches built across all companies.
+FINANCIALS_SCOPE = "financials"
 
-    if cursor.execute("SELECT COUNT(*) FROM companies").fetchone()[0] == 0:
-        cursor.execute("INSERT INTO companies (name, group_name) VALUES (?, ?)", ('Reliance Jio', 'Reliance'))
-        cursor.execute("INSERT INTO companies (name, group_name) VALUES (?, ?)", ('Reliance Retail', 'Reliance'))
+def company_scope(company_id):
+    """Data version scope covering one company's financials."""
+    return f"company:{int(company_id)}"
 
-    if cursor.execute("SELECT COUNT(*) FROM user_company_access").fetchone()[0] == 0:
-        cursor.execute("INSERT INTO user_company_access (user_id, company_id) VALUES ((SELECT id FROM users WHERE username='jio_ceo'), (SELECT id FROM companies WHERE name='Reliance Jio'))")
+def bump_data_versions(conn, scopes):
+    """Increments the version of each scope; call inside the writing transaction."""
+    conn.executemany(
+        "INSERT INTO data_versions (scope, version) VALUES (?, 1) ON CONFLICT(scope) DO UPDATE SET version = version + 1",
+        [(scope,) for scope in sorted(set(scopes))]
+    )
 
-    conn.commit()
-    conn.close()
+def get_data_versions(scopes):
+    """Returns {scope: version} in one read; scopes never written report 0."""
+    scopes = list(scopes)
+    conn = get_db_connection()
+    placeholders = ", ".join("?" for _ in scopes)
+    rows = conn.execute(f"SELECT scope, version FROM data_versions WHERE scope IN ({placeholders})", scopes).fetchall()
+    versions = dict.fromkeys(scopes, 0)
+    versions.update({row["scope"]: row["version"] for row in rows})
+    return versions
+
+def get_data_version(scope):
+    return get_data_versions([scope])[scope]
 
 def get_user(username):
     conn = get_db_connection()
     user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-    conn.close()
     return user
 
 def get_user_accessible_companies(user_id, role):
@@ -49,30 +261,252 @@ def get_user_accessible_companies(user_id, role):
         companies = conn.execute('SELECT c.* FROM companies c JOIN user_company_access uca ON c.id = uca.company_id WHERE uca.user_id = ?', (user_id,)).fetchall()
     else:
         companies = []
-    conn.close()
     return companies
 
 def get_all_companies():
     conn = get_db_connection()
     companies = conn.execute('SELECT * FROM companies ORDER BY name').fetchall()
-    conn.close()
     return companies
 
+# Unit words that may trail a value, and the factor that converts them to crore.
+VALUE_UNIT_SCALES = {
+    "crores": 1.0, "crore": 1.0, "cr": 1.0,
+    "lakhs": 0.01, "lakh": 0.01, "lacs": 0.01, "lac": 0.01,
+    "millions": 0.1, "million": 0.1, "mn": 0.1,
+    "billions": 100.0, "billion": 100.0, "bn": 100.0,
+    "thousands": 0.0001, "thousand": 0.0001,
+}
+_UNIT_PATTERN = r"\s*(" + "|".join(sorted(VALUE_UNIT_SCALES, key=len, reverse=True)) + r")\.?\s*$"
+
+def clean_metric_values(raw_values):
+    """
+    Converts a Series of reported values into floats in one vectorized pass.
+    Strips currency symbols and commas, turns (123.45) into -123.45 and
+    scales trailing unit words (lakh, million, ...) into crore. Unparseable
+    values come back as NaN.
+    """
+    import pandas as pd
+    raw_values = pd.Series(raw_values, dtype=object)
+    # Values that are already numbers skip the string pipeline entirely.
+    is_number = raw_values.map(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool))
+    numeric = pd.to_numeric(raw_values.where(is_number), errors="coerce")
+
+    text = raw_values.astype(str).str.strip().str.lower()
+    text = text.str.replace(r"₹|rs\.?|inr|\$|`", "", regex=True).str.strip()
+    units = text.str.extract(_UNIT_PATTERN, expand=False)
+    text = text.str.replace(_UNIT_PATTERN, "", regex=True).str.replace(",", "", regex=False).str.strip()
+    negative = text.str.startswith("(") & text.str.endswith(")")
+    text = text.str.strip("()").str.strip()
+    parsed = pd.to_numeric(text, errors="coerce")
+    parsed = parsed.where(~negative, -parsed) * units.map(VALUE_UNIT_SCALES).fillna(1.0)
+
+    return numeric.fillna(parsed).astype(float)
+
+def _get_metric_ids(conn, names):
+    """Returns {name: id} for the given metric names, adding any new ones."""
+    names = sorted(names)
+    conn.executemany("INSERT OR IGNORE INTO metrics (name) VALUES (?)", [(name,) for name in names])
+    placeholders = ", ".join("?" for _ in names)
+    return {row["name"]: row["id"] for row in conn.execute(f"SELECT id, name FROM metrics WHERE name IN ({placeholders})", names)}
+
+def save_financial_data_bulk(records):
+    """
+    Upserts many (company_id, year, metrics[, source_document]) records in a
+    single transaction. Values are cleaned with clean_metric_values, and a
+    later record wins if the same (company, year, metric) appears twice.
+    Returns counts of inserted, updated and rejected rows.
+    """
+    import pandas as pd
+    rows = [
+        (record[0], record[1], metric, value, record[3] if len(record) > 3 else None)
+        for record in records
+        for metric, value in record[2].items()
+    ]
+    counts = {"inserted": 0, "updated": 0, "rejected": 0}
+    if not rows:
+        return counts
+
+    df = pd.DataFrame(rows, columns=["company_id", "year", "metric", "raw", "source_document"])
+    df["value"] = clean_metric_values(df["raw"])
+    valid = df["value"].notna() & df["metric"].notna()
+    counts["rejected"] = int((~valid).sum())
+    df = df[valid].drop_duplicates(subset=["company_id", "year", "metric"], keep="last")
+    if df.empty:
+        return counts
+
+    params = list(df[["company_id", "year", "metric", "value", "source_document"]].itertuples(index=False, name=None))
+    params = [(int(c), int(y), m, float(v), s) for c, y, m, v, s in params]
+
+    conn = get_db_connection()
+    with conn:
+        metric_ids = _get_metric_ids(conn, {row[2] for row in params})
+        named_params = params
+        params = [(c, y, metric_ids[m], v, s) for c, y, m, v, s in params]
+
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_keys (company_id INTEGER, year INTEGER, metric_id INTEGER)")
+        conn.execute("DELETE FROM bulk_keys")
+        conn.executemany("INSERT INTO bulk_keys VALUES (?, ?, ?)", [row[:3] for row in params])
+        existing = conn.execute(
+            "SELECT COUNT(*) FROM bulk_keys k JOIN financial_data f ON f.company_id = k.company_id AND f.year = k.year AND f.metric_id = k.metric_id"
+        ).fetchone()[0]
+        conn.executemany(
+            'INSERT INTO financial_data (company_id, year, metric_id, value, source_document, in_crore) VALUES (?, ?, ?, ?, ?, 1) '
+            'ON CONFLICT(company_id, year, metric_id) DO UPDATE SET value = excluded.value, source_document = excluded.source_document, in_crore = 1',
+            params
+        )
+        _update_company_snapshots(conn, [(c, y, m, v) for c, y, m, v, _ in named_params])
+        bump_data_versions(conn, [company_scope(row[0]) for row in params] + [FINANCIALS_SCOPE])
+    counts["updated"] = existing
+    counts["inserted"] = len(params) - existing
+    return counts
+
 def save_financial_data(company_id, year, metrics, source_document):
+    """Saves one document's metrics; see save_financial_data_bulk."""
+    return save_financial_data_bulk([(company_id, year, metrics, source_document)])
+
+# --- COMPANY SNAPSHOTS ---
+# The frame is stored as JSON {"metrics": [...], "years": [...], "values": [[...]],
+# "unrecorded": [[metric, year], ...]} (rows follow metrics, columns follow years,
+# null for a missing value; unrecorded lists cells saved before amounts were
+# normalized to crore, whose unit is unknown).
+
+def _snapshot_frame(payload):
+    import pandas as pd
+    return pd.DataFrame(payload["values"], index=pd.Index(payload["metrics"], name="metric"),
+                        columns=pd.Index(payload["years"], name="year"), dtype=float)
+
+def _store_company_snapshot(cursor, company_id, frame, unrecorded=()):
+    frame = frame.sort_index().sort_index(axis=1)
+    payload = {
+        "metrics": list(frame.index),
+        "years": [int(year) for year in frame.columns],
+        "values": frame.astype(object).where(frame.notna(), None).values.tolist(),
+        "unrecorded": sorted([metric, int(year)] for metric, year in unrecorded),
+    }
+    cursor.execute(
+        "INSERT OR REPLACE INTO company_snapshots (company_id, frame, updated_at) VALUES (?, ?, ?)",
+        (company_id, json.dumps(payload), time.time())
+    )
+
+def _rebuild_company_snapshot(cursor, company_id):
+    """Pivots every stored row for one company into its snapshot."""
+    import pandas as pd
+    rows = cursor.execute(
+        "SELECT f.year, m.name AS metric, f.value, f.in_crore FROM financial_data f JOIN metrics m ON m.id = f.metric_id WHERE f.company_id = ?",
+        (company_id,)
+    ).fetchall()
+    df = pd.DataFrame([tuple(row) for row in rows], columns=["year", "metric", "value", "in_crore"])
+    unrecorded = [(row.metric, row.year) for row in df[df["in_crore"] == 0].itertuples()]
+    _store_company_snapshot(cursor, company_id, df.pivot(index="metric", columns="year", values="value").astype(float),
+                            unrecorded)
+
+def _update_company_snapshots(conn, rows):
+    """
+    Applies freshly written (company_id, year, metric, value) rows to each
+    company's stored snapshot, so only the changed cells are touched.
+    """
+    by_company = {}
+    for company_id, year, metric, value in rows:
+        by_company.setdefault(company_id, []).append((year, metric, value))
+
+    for company_id, cells in by_company.items():
+        stored = conn.execute("SELECT frame FROM company_snapshots WHERE company_id = ?", (company_id,)).fetchone()
+        if stored is None:
+            _rebuild_company_snapshot(conn, company_id)
+            continue
+        payload = json.loads(stored["frame"])
+        frame = _snapshot_frame(payload)
+        # Freshly written cells are in crore.
+        unrecorded = {tuple(cell) for cell in payload.get("unrecorded", [])}
+        for year, metric, value in cells:
+            frame.loc[metric, year] = value
+            unrecorded.discard((metric, year))
+        _store_company_snapshot(conn, company_id, frame, unrecorded)
+
+def get_company_snapshot(company_id):
+    """
+    Returns (snapshot_df, unrecorded) for a company, where snapshot_df is
+    the metric x year table and unrecorded the set of (metric, year) cells
+    saved before amounts were normalized to crore, or (None, None) if
+    nothing has been saved for it yet.
+    """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    for metric, value in metrics.items():
-        try:
-            cleaned_value = float(str(value).replace(',', '').replace('(', '-').replace(')', ''))
-        except (ValueError, TypeError):
-            cleaned_value = None
-        if cleaned_value is not None:
-            cursor.execute('INSERT OR REPLACE INTO financial_data (company_id, year, metric, value, source_document) VALUES (?, ?, ?, ?, ?)', (company_id, year, metric, cleaned_value, source_document))
-    conn.commit()
-    conn.close()
+    row = conn.execute("SELECT frame FROM company_snapshots WHERE company_id = ?", (company_id,)).fetchone()
+    if row is None:
+        return None, None
+    payload = json.loads(row["frame"])
+    return _snapshot_frame(payload), {(metric, year) for metric, year in payload.get("unrecorded", [])}
 
 def get_company_financials(company_id):
     conn = get_db_connection()
-    data = conn.execute('SELECT year, metric, value FROM financial_data WHERE company_id = ? ORDER BY year, metric', (company_id,)).fetchall()
-    conn.close()
-    return data
\ No newline at end of file
+    # Reads straight off the (company_id, year, metric_id) primary key.
+    data = conn.execute('SELECT f.year, m.name AS metric, f.value FROM financial_data f JOIN metrics m ON m.id = f.metric_id WHERE f.company_id = ? ORDER BY f.year, m.name', (company_id,)).fetchall()
+    return data
+
+def get_group_financials(company_ids):
+    """Returns (company_id, year, metric, value) rows for several companies in one query."""
+    company_ids = [int(company_id) for company_id in company_ids]
+    if not company_ids:
+        return []
+    conn = get_db_connection()
+    placeholders = ", ".join("?" for _ in company_ids)
+    data = conn.execute(
+        f'SELECT f.company_id, f.year, m.name AS metric, f.value FROM financial_data f JOIN metrics m ON m.id = f.metric_id '
+        f'WHERE f.company_id IN ({placeholders}) ORDER BY f.company_id, f.year, m.name',
+        company_ids
+    ).fetchall()
+    return data
+
+def get_company_by_name(name):
+    conn = get_db_connection()
+    company = conn.execute('SELECT * FROM companies WHERE name = ?', (name,)).fetchone()
+    return company
+
+# --- INGESTION JOB LEDGER ---
+INGEST_JOB_FIELDS = {"file_path", "source_document", "status", "pages_done", "pages_total", "llm_calls", "keys_filled", "error",
+                     "created_at", "started_at", "finished_at", "source", "submitted_by"}
+
+def get_or_create_ingest_job(file_path, file_hash, company_id, year, source, submitted_by=None):
+    """Returns the ledger row for this document, creating a 'queued' one if needed."""
+    conn = get_db_connection()
+    with conn:
+        conn.execute(
+            'INSERT OR IGNORE INTO ingest_jobs (file_path, file_hash, company_id, year, source, submitted_by, status, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (file_path, file_hash, company_id, year, source, submitted_by, 'queued', time.time())
+        )
+    job = conn.execute('SELECT * FROM ingest_jobs WHERE file_hash = ? AND company_id = ? AND year = ?', (file_hash, company_id, year)).fetchone()
+    return job
+
+def update_ingest_job(job_id, **fields):
+    unknown = set(fields) - INGEST_JOB_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown ingest job fields: {', '.join(sorted(unknown))}")
+    if not fields:
+        return
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    conn = get_db_connection()
+    with conn:
+        conn.execute(f'UPDATE ingest_jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+def get_ingest_job(job_id):
+    conn = get_db_connection()
+    job = conn.execute('SELECT * FROM ingest_jobs WHERE id = ?', (job_id,)).fetchone()
+    return job
+
+def get_recent_ingest_jobs(submitted_by=None, limit=10):
+    """Most recent jobs first, with the company name attached."""
+    conn = get_db_connection()
+    query = 'SELECT j.*, c.name AS company_name FROM ingest_jobs j LEFT JOIN companies c ON c.id = j.company_id'
+    params = ()
+    if submitted_by is not None:
+        query += ' WHERE j.submitted_by = ?'
+        params = (submitted_by,)
+    jobs = conn.execute(query + ' ORDER BY j.created_at DESC LIMIT ?', (*params, limit)).fetchall()
+    return jobs
+
+def fail_interrupted_ingest_jobs(source, reason):
+    """Marks jobs left queued or running by a previous process as failed."""
+    conn = get_db_connection()
+    with conn:
+        conn.execute("UPDATE ingest_jobs SET status = 'failed', error = ?, finished_at = ? WHERE source = ? AND status IN ('queued', 'running')",
+                     (reason, time.time(), source))
@@ -0,0 +1,121 @@
+# utils/extraction_cache.py
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import utils.database as database
+from utils.database import get_db_connection
+
+# Content-addressed cache for structure_data_with_groq results. The key covers
+# everything that can change the answer (page text, year, model, prompt
+# version), so an unchanged page never needs a second remote call.
+
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_AGE_SECONDS = 90 * 24 * 3600
+
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+_ready = set()   # DB_NAME values whose llm_extraction_cache table exists
+
+
+def _ensure_table(conn):
+    if database.DB_NAME in _ready:
+        return
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS llm_extraction_cache (
+            cache_key TEXT PRIMARY KEY,
+            model TEXT,
+            prompt_version TEXT,
+            result TEXT,
+            created_at REAL,
+            last_used_at REAL,
+            hit_count INTEGER DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_extraction_cache (last_used_at)")
+    conn.commit()
+    _ready.add(database.DB_NAME)
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def make_cache_key(text, year, model, prompt_version):
+    """Returns a SHA-256 hex digest identifying one extraction request."""
+    digest = hashlib.sha256()
+    for part in (model, str(prompt_version), str(year), text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def get_cached_extraction(cache_key):
+    """Returns the cached result dict for cache_key, or None on a miss."""
+    conn = get_db_connection()
+    _ensure_table(conn)
+    row = conn.execute("SELECT result FROM llm_extraction_cache WHERE cache_key = ?", (cache_key,)).fetchone()
+    if row is None:
+        _count("misses")
+        return None
+    # The touch only feeds eviction; a locked database must not turn a hit into a miss.
+    try:
+        with conn:
+            conn.execute(
+                "UPDATE llm_extraction_cache SET last_used_at = ?, hit_count = hit_count + 1 WHERE cache_key = ?",
+                (time.time(), cache_key),
+            )
+    except sqlite3.Error as e:
+        print(f"Could not record extraction cache hit: {e}")
+    _count("hits")
+    return json.loads(row["result"])
+
+
+def store_extraction(cache_key, model, prompt_version, result):
+    """Saves a successful extraction result under cache_key."""
+    now = time.time()
+    conn = get_db_connection()
+    _ensure_table(conn)
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_extraction_cache (cache_key, model, prompt_version, result, created_at, last_used_at, hit_count) "
+            "VALUES (?, ?, ?, ?, ?, ?, 0)",
+            (cache_key, model, str(prompt_version), json.dumps(result), now, now),
+        )
+    _count("stores")
+
+
+def evict_extraction_cache(max_entries=DEFAULT_MAX_ENTRIES, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+    """
+    Removes entries older than max_age_seconds, then trims the least recently
+    used entries until at most max_entries remain. Returns the number removed.
+    """
+    conn = get_db_connection()
+    _ensure_table(conn)
+    with conn:
+        removed = conn.execute(
+            "DELETE FROM llm_extraction_cache WHERE created_at < ?", (time.time() - max_age_seconds,)
+        ).rowcount
+        removed += conn.execute("""
+            DELETE FROM llm_extraction_cache WHERE cache_key IN (
+                SELECT cache_key FROM llm_extraction_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (max_entries,)).rowcount
+    if removed:
+        _count("evictions", removed)
+    return removed
+
+
+def extraction_cache_stats():
+    """Returns hit/miss counters for this process plus the current entry count."""
+    conn = get_db_connection()
+    _ensure_table(conn)
+    entries = conn.execute("SELECT COUNT(*) FROM llm_extraction_cache").fetchone()[0]
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["entries"] = entries
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
@@ -0,0 +1,311 @@
+# utils/groq_gateway.py
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+from utils.chat_context import message_tokens
+
+# Every Groq request in the process goes through complete(), so batch
+# ingestion and live chat share one view of the account's quota:
+#   - a token bucket per model for tokens per minute, resynced from the
+#     x-ratelimit-* response headers, plus a pause when the daily request
+#     quota or a retry-after says so;
+#   - adaptive concurrency (AIMD): one more request in flight per window of
+#     successes, half as many after a 429 or 503;
+#   - retries with exponential backoff and full jitter for 429s, 5xx and
+#     connection errors;
+#   - chat first: chat requests queue ahead of ingestion, and ingestion
+#     leaves a slot and a share of the bucket free for them.
+
+PRIORITY_CHAT = 0
+PRIORITY_INGEST = 1
+
+# Starting limits until the response headers report the real ones.
+DEFAULT_REQUESTS_PER_MINUTE = int(os.environ.get("GROQ_REQUESTS_PER_MINUTE", 30))
+DEFAULT_TOKENS_PER_MINUTE = int(os.environ.get("GROQ_TOKENS_PER_MINUTE", 30000))
+
+INITIAL_CONCURRENCY = 4
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 16
+# Slots and bucket share that ingestion leaves free for chat.
+CHAT_RESERVED_SLOTS = 1
+CHAT_RESERVE_FRACTION = 0.2
+
+# Retries per request after the first attempt; chat gives up sooner since a user is waiting.
+MAX_RETRIES = {PRIORITY_CHAT: 2, PRIORITY_INGEST: 5}
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_CAP_SECONDS = 20.0
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Statuses that mean "slow down" rather than a one-off failure.
+THROTTLE_STATUS = {429, 503}
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class RequestCancelled(Exception):
+    """Raised by complete() when its cancelled event is set before the request is sent."""
+
+
+def parse_duration(value):
+    """Seconds in a header value such as '7.66s', '2m59.56s', '120ms' or '30'; None if unreadable."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _header_int(headers, name):
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refills continuously at capacity per minute; not thread-safe on its own."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60.0)
+        self._updated = now
+
+    def delay(self, amount, reserve=0.0):
+        """Seconds until amount can be taken while leaving reserve (a fraction of capacity) untouched."""
+        self._refill(time.monotonic())
+        amount = min(amount, self.capacity * (1.0 - reserve))
+        missing = amount + reserve * self.capacity - self.level
+        return 0.0 if missing <= 0 else missing * 60.0 / self.capacity
+
+    def take(self, amount):
+        self._refill(time.monotonic())
+        self.level -= min(amount, self.capacity)
+
+    def sync(self, limit, remaining):
+        """Adopts the server's limit and never believes in more headroom than it reports."""
+        self._refill(time.monotonic())
+        if limit:
+            # Keep what has been spent this minute, not the fill level, across a new limit.
+            self.level = max(0.0, self.level + float(limit) - self.capacity)
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+
+
+class RateLimitGate:
+    """Admission control for one model's quota; see the module comment."""
+
+    def __init__(self, model, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE):
+        self.model = model
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.limit = float(INITIAL_CONCURRENCY)
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = []          # heap of (priority, sequence) tickets
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._stats = {"requests": 0, "throttled": 0, "retries": 0, "failures": 0, "cancelled": 0}
+
+    def _admission_delay(self, ticket, tokens):
+        """0 when ticket may go now, seconds to wait for the quota, or None to wait for a release."""
+        if self._waiting[0] != ticket:
+            return None
+        chat = ticket[0] == PRIORITY_CHAT
+        slots = int(self.limit)
+        if not chat and slots > CHAT_RESERVED_SLOTS:
+            slots -= CHAT_RESERVED_SLOTS
+        if self._in_flight >= slots:
+            return None
+        now = time.monotonic()
+        if now < self._paused_until:
+            return self._paused_until - now
+        reserve = 0.0 if chat else CHAT_RESERVE_FRACTION
+        return max(self.requests.delay(1, reserve), self.tokens.delay(tokens, reserve))
+
+    def acquire(self, priority, tokens, cancelled=None):
+        """
+        Blocks until a request of about `tokens` tokens may be sent. Returns
+        False, taking nothing, if the cancelled event is set first.
+        """
+        with self._cond:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if cancelled is not None and cancelled.is_set():
+                        self._stats["cancelled"] += 1
+                        return False
+                    delay = self._admission_delay(ticket, tokens)
+                    if delay == 0:
+                        break
+                    self._cond.wait(delay)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self._in_flight += 1
+            self._stats["requests"] += 1
+            return True
+
+    def release(self, throttled=False, succeeded=True):
+        """Frees the slot and adjusts the concurrency limit (additive increase, multiplicative decrease)."""
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self.limit = max(float(MIN_CONCURRENCY), self.limit / 2)
+                self._stats["throttled"] += 1
+            elif succeeded:
+                self.limit = min(float(MAX_CONCURRENCY), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def pause(self, seconds):
+        """Holds every request for this model, e.g. for a retry-after."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def observe(self, headers):
+        """
+        Applies Groq's x-ratelimit-* headers. On Groq the request headers
+        count requests per day and the token headers tokens per minute, so
+        the former only pause us once the day's quota is spent.
+        """
+        if not headers:
+            return
+        with self._cond:
+            self.tokens.sync(_header_int(headers, "x-ratelimit-limit-tokens"),
+                             _header_int(headers, "x-ratelimit-remaining-tokens"))
+            if _header_int(headers, "x-ratelimit-remaining-requests") == 0:
+                reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+                if reset:
+                    self._paused_until = max(self._paused_until, time.monotonic() + reset)
+            self._cond.notify_all()
+
+    def count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "model": self.model,
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self._in_flight,
+                "waiting_chat": sum(1 for priority, _ in self._waiting if priority == PRIORITY_CHAT),
+                "waiting_ingest": sum(1 for priority, _ in self._waiting if priority != PRIORITY_CHAT),
+                "tokens_available": round(self.tokens.level),
+                "tokens_per_minute": round(self.tokens.capacity),
+                "paused_seconds": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            })
+        return stats
+
+
+_gates = {}
+_gates_lock = threading.Lock()
+
+
+def get_gate(model):
+    with _gates_lock:
+        if model not in _gates:
+            _gates[model] = RateLimitGate(model)
+        return _gates[model]
+
+
+def classify_error(error):
+    """(retryable, throttled, retry_after_seconds) for an exception from the Groq client."""
+    status = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    retry_after = parse_duration(headers.get("retry-after"))
+    if status is None:
+        # groq.APIConnectionError and APITimeoutError carry no status code.
+        name = type(error).__name__
+        return ("Connection" in name or "Timeout" in name), False, retry_after
+    return status in RETRYABLE_STATUS, status in THROTTLE_STATUS, retry_after
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given retry (1-based)."""
+    return random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def complete(client, priority, on_retry=None, estimated_tokens=None, cancelled=None, on_send=None, **request):
+    """
+    Sends client.chat.completions.create(**request) through the model's
+    gate, retrying throttling and transient errors. on_retry(attempt, error)
+    is called before each retry and on_send() once, just before the first
+    attempt goes out. Returns the response (a chunk iterator when
+    streaming); the last error is raised once retries run out.
+
+    If the cancelled event is set while the request waits for the gate or
+    for a retry, RequestCancelled is raised and nothing more is sent.
+    """
+    gate = get_gate(request.get("model"))
+    if estimated_tokens is None:
+        estimated_tokens = sum(message_tokens(m) for m in request.get("messages", [])) + (request.get("max_tokens") or 0)
+    completions = client.chat.completions
+    # The raw response carries the rate-limit headers; stand-in clients may not offer it.
+    raw = getattr(completions, "with_raw_response", None)
+
+    attempt = 0
+    while True:
+        # The slot is held until create() returns: the whole answer, or the headers of a stream.
+        if not gate.acquire(priority, estimated_tokens, cancelled):
+            raise RequestCancelled()
+        if on_send is not None and attempt == 0:
+            on_send()
+        try:
+            if raw is not None:
+                raw_response = raw.create(**request)
+                headers = raw_response.headers
+                response = raw_response.parse()
+            else:
+                headers = None
+                response = completions.create(**request)
+        except Exception as error:
+            retryable, throttled, retry_after = classify_error(error)
+            gate.release(throttled=throttled, succeeded=False)
+            if retry_after:
+                gate.pause(retry_after)
+            if not retryable or attempt >= MAX_RETRIES[priority]:
+                gate.count("failures")
+                raise
+            attempt += 1
+            gate.count("retries")
+            if on_retry is not None:
+                on_retry(attempt, error)
+            delay = max(retry_after or 0.0, backoff_delay(attempt))
+            if cancelled is not None:
+                cancelled.wait(delay)
+            else:
+                time.sleep(delay)
+            continue
+        gate.release()
+        gate.observe(headers)
+        return response
+
+
+def gateway_stats():
+    """Current limits, queue and counters for every model used in this process."""
+    with _gates_lock:
+        gates = list(_gates.values())
+    return [gate.stats() for gate in gates]
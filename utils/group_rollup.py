@@ -0,0 +1,35 @@
+# utils/group_rollup.py
+import pandas as pd
+from utils.database import get_group_financials
+
+# Consolidated view over the companies that share a group_name. Member rows
+# come back in one query and are summed per (metric, year) in one groupby.
+
+# Per-share figures cannot be added across companies.
+NON_ADDITIVE_METRICS = {"Earnings Per Share (Basic)"}
+
+
+def group_members(companies, group_name):
+    """The companies from an access-filtered list that belong to group_name."""
+    return [c for c in companies if c["group_name"] == group_name]
+
+
+def build_group_rollup(company_ids):
+    """
+    Returns (rollup_df, members_df) for a set of companies. rollup_df is a
+    metric x year frame of summed additive metrics (a year's total only
+    covers the members that reported it); members_df holds the long-form
+    company_id/year/metric/value rows behind it. Both are None when no
+    member has any data.
+    """
+    rows = get_group_financials(company_ids)
+    if not rows:
+        return None, None
+    members_df = pd.DataFrame([tuple(row) for row in rows], columns=["company_id", "year", "metric", "value"])
+    additive = members_df[~members_df["metric"].isin(NON_ADDITIVE_METRICS)]
+    rollup_df = (
+        additive.groupby(["metric", "year"], sort=True)["value"].sum(min_count=1)
+        .unstack("year")
+        .sort_index()
+    )
+    return rollup_df, members_df
@@ -0,0 +1,94 @@
+# utils/ingestion.py
+import hashlib
+import os
+import time
+from utils.llm_helper import process_pdf_pages, REQUIRED_KEYS
+from utils.database import save_financial_data, get_or_create_ingest_job, update_ingest_job
+from utils.telemetry import span, flush_spans
+
+# One place that runs a report through the full pipeline and keeps the
+# ingest_jobs ledger up to date, shared by the batch CLI and the Upload page.
+
+# Progress is written to the ledger at most this often (seconds).
+PROGRESS_WRITE_INTERVAL = 1.0
+
+
+def file_sha256(path):
+    """Hashes the file contents so a renamed copy is still recognised."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_ingest_job(job_id, pdf_path, company_id, year, source_document, pdf_workers=1):
+    """
+    Runs extract_pages_from_pdf -> process_pdf_pages -> save_financial_data
+    for an existing ingest_jobs row, writing live progress (pages_done,
+    llm_calls, keys_filled) as it goes. Returns a dict with the status,
+    page and LLM call counts and per-stage timings in seconds.
+    """
+    result = {"job_id": job_id, "file": source_document, "status": "running", "pages": 0,
+              "llm_calls": 0, "keys_filled": 0, "seconds": 0.0}
+    update_ingest_job(job_id, status="running", started_at=time.time(), finished_at=None, error=None,
+                      pages_done=0, llm_calls=0, keys_filled=0)
+    last_write = 0.0
+
+    def on_progress(progress):
+        nonlocal last_write
+        now = time.monotonic()
+        if now - last_write >= PROGRESS_WRITE_INTERVAL:
+            last_write = now
+            update_ingest_job(job_id, **progress)
+
+    from utils.pdf_processor import extract_pages_from_pdf  # pdfplumber loads with the first job
+
+    started = time.perf_counter()
+    try:
+        # Streaming lets PDF parsing overlap with the LLM calls.
+        pages = extract_pages_from_pdf(pdf_path, workers=pdf_workers, stream=True)
+        stats = {}
+        financial_data = process_pdf_pages(pages, year, stats=stats, pdf_path=pdf_path, on_progress=on_progress)
+        extracted = time.perf_counter()
+
+        result["pages"] = stats.get("pages_total", 0)
+        result["llm_calls"] = stats.get("llm_calls_dispatched", 0)
+        result["extract_seconds"] = extracted - started
+
+        if "error" in financial_data:
+            raise RuntimeError(financial_data["error"])
+
+        with span("db_save", job_id=job_id, company_id=company_id, year=year) as save:
+            save.set(**save_financial_data(company_id, year, financial_data, source_document))
+        result["save_seconds"] = time.perf_counter() - extracted
+        result["keys_filled"] = sum(1 for key in REQUIRED_KEYS if financial_data.get(key) is not None)
+        result["status"] = "done"
+        update_ingest_job(job_id, status="done", finished_at=time.time(), pages_done=result["pages"],
+                          pages_total=result["pages"], llm_calls=result["llm_calls"], keys_filled=result["keys_filled"])
+    except Exception as e:
+        print(f"Ingestion failed for {source_document}: {e}")
+        result["status"] = "failed"
+        result["error"] = str(e)
+        update_ingest_job(job_id, status="failed", finished_at=time.time(), error=str(e),
+                          pages_total=result["pages"], llm_calls=result["llm_calls"])
+    result["seconds"] = time.perf_counter() - started
+    # The job's spans are on disk as soon as it finishes, for the metrics page.
+    flush_spans()
+    return result
+
+
+def ingest_document(pdf_path, company_id, year, source_document=None, source="cli", pdf_workers=1, force=False):
+    """
+    Ingests one PDF synchronously and records the outcome in the ingest_jobs
+    ledger. Documents already marked 'done' for the same company and year
+    are skipped unless force=True.
+    """
+    source_document = source_document or os.path.basename(pdf_path)
+    job = get_or_create_ingest_job(pdf_path, file_sha256(pdf_path), company_id, year, source)
+    if job["status"] == "done" and not force:
+        return {"job_id": job["id"], "file": source_document, "status": "skipped", "pages": job["pages_total"] or 0,
+                "llm_calls": job["llm_calls"] or 0, "keys_filled": job["keys_filled"] or 0, "seconds": 0.0}
+
+    update_ingest_job(job["id"], file_path=pdf_path, source_document=source_document)
+    return run_ingest_job(job["id"], pdf_path, company_id, year, source_document, pdf_workers)
@@ -0,0 +1,171 @@
+# utils/intent_router.py
+import re
+import threading
+from utils.answer_cache import normalize_question
+
+# Answers plain chart requests ("plot revenue growth", "bar chart of net
+# profit") locally by mapping them onto the plot_request the model would
+# have produced. Anything open-ended or ambiguous is left for Groq.
+
+# Chat phrasings for each metric, matched on whole words, longest first.
+CHAT_METRIC_SYNONYMS = {
+    "Revenue from Operations": ["revenue from operations", "operating revenue", "revenue", "sales", "turnover", "top line", "topline"],
+    "Other Income": ["other income", "non operating income"],
+    "Total Income": ["total income", "total revenue"],
+    "Profit Before Tax": ["profit before tax", "pre tax profit", "pretax profit", "pbt"],
+    "Net Profit": ["net profit", "profit after tax", "net income", "pat", "bottom line", "profit", "earnings"],
+    "Total Equity": ["total equity", "shareholders equity", "shareholder equity", "net worth", "equity"],
+    "Total Assets": ["total assets", "assets"],
+    "Total Liabilities": ["total liabilities", "liabilities"],
+    "Non-current assets": ["non current assets", "noncurrent assets", "long term assets", "fixed assets"],
+    "Current assets": ["current assets"],
+    "Non-current liabilities": ["non current liabilities", "noncurrent liabilities", "long term liabilities"],
+    "Current liabilities": ["current liabilities", "short term liabilities"],
+    "Cash and cash equivalents": ["cash and cash equivalents", "cash position", "cash balance", "cash"],
+    "Earnings Per Share (Basic)": ["earnings per share", "basic eps", "eps"],
+}
+
+# "show" and "display" alone are not chart requests ("show return on equity").
+CHART_WORDS = {"plot", "chart", "graph", "visualize", "visualise", "draw", "trend", "bar", "line"}
+GROWTH_PHRASES = ["growth", "grow", "grew", "grown", "growing", "yoy", "year over year", "year on year", "change"]
+BAR_WORDS = {"bar", "bars", "column", "histogram"}
+# Phrases that ask for a chart without a chart word ("revenue over the years").
+TREND_PHRASES = ["trend", "over time", "over the years", "history", "trajectory"]
+COMPARE_WORDS = {"compare", "comparison", "vs", "versus", "against"}
+# Ratios are not stored metrics, though they name some ("debt to equity",
+# "net profit margin"); questions about them go to the model, which has the
+# ratio table. EPS is a stored metric, so "earnings per share" is not a ratio.
+RATIO_PHRASES = [
+    "ratio", "ratios", "return on", "margin", "margins", "roe", "roa", "roce", "roi", "debt", "leverage", "gearing",
+    "coverage", "per share", "book value", "payout", "turnover of", "asset turnover", "inventory turnover",
+    "receivables turnover", "times interest", "as a percentage", "as a percent", "percent of",
+]
+_EPS_PHRASE = re.compile(r"\bearnings per (?:equity )?share\b")
+# Line items we do not store whose names contain a metric synonym; matching
+# the bare synonym would chart the wrong metric ("operating profit" is not
+# net profit, "cash flow from operations" is not the cash balance).
+UNSTORED_COMPOUNDS = [
+    "operating profit", "gross profit", "operating income", "cash flow", "cash flows", "free cash",
+    "change in equity", "changes in equity", "equity share capital",
+]
+# Questions asking for judgement or explanation go to the model.
+OPEN_ENDED_WORDS = {
+    "why", "explain", "should", "risk", "risks", "recommend", "advice", "opinion", "insight", "insights",
+    "analyse", "analyze", "analysis", "assess", "evaluate", "if", "reason", "reasons", "driver", "drivers",
+    "forecast", "predict", "outlook", "summary", "summarize", "summarise",
+}
+
+_SYNONYM_PATTERNS = sorted(
+    ((re.compile(rf"\b{re.escape(phrase)}\b"), metric, len(phrase))
+     for metric, phrases in CHAT_METRIC_SYNONYMS.items() for phrase in phrases),
+    key=lambda item: item[2], reverse=True,
+)
+
+_stats = {"routed": 0, "passed": 0}
+_stats_lock = threading.Lock()
+
+
+def _has_phrase(text, phrases):
+    return any(re.search(rf"\b{re.escape(phrase)}\b", text) for phrase in phrases)
+
+
+def find_metrics(text):
+    """
+    Metrics mentioned in normalized text and the text left once their
+    phrases are removed; longer phrases claim their words first.
+    """
+    found = []
+    for pattern, metric, _ in _SYNONYM_PATTERNS:
+        if pattern.search(text):
+            if metric not in found:
+                found.append(metric)
+            text = pattern.sub(" ", text)
+    return found, " ".join(text.split())
+
+
+def parse_intent(prompt, available_metrics):
+    """
+    Returns a plot_request dict ({"type", "metric", "title"}) when the
+    prompt is an unambiguous chart request for data we have, else None.
+    """
+    text = normalize_question(prompt)
+    words = set(text.split())
+    if not text or words & OPEN_ENDED_WORDS:
+        return None
+    if _has_phrase(_EPS_PHRASE.sub(" ", text), RATIO_PHRASES) or _has_phrase(text, UNSTORED_COMPOUNDS):
+        return None
+
+    # Chart words are looked for outside the metric names ("top line", "bottom line").
+    metrics, rest = find_metrics(text)
+    wants_growth = _has_phrase(rest, GROWTH_PHRASES)
+    wants_chart = bool(set(rest.split()) & CHART_WORDS) or wants_growth or _has_phrase(rest, TREND_PHRASES)
+
+    if set(metrics) == {"Total Assets", "Total Liabilities"} and (words & COMPARE_WORDS or wants_chart or "and" in words):
+        if {"Total Assets", "Total Liabilities"} & set(available_metrics):
+            return {"type": "asset_liability_comparison", "metric": "Total Assets",
+                    "title": "Total Assets vs. Total Liabilities Over Years"}
+        return None
+
+    if not wants_chart or len(metrics) != 1 or metrics[0] not in available_metrics:
+        return None
+    metric = metrics[0]
+    if wants_growth:
+        return {"type": "growth", "metric": metric, "title": f"Year-over-Year Growth of {metric}"}
+    if words & BAR_WORDS:
+        return {"type": "bar", "metric": metric, "title": f"{metric} by Year"}
+    return {"type": "line", "metric": metric, "title": f"{metric} Over Years"}
+
+
+def _series(df, metric):
+    rows = df[df["metric"] == metric].sort_values("year")
+    return list(zip(rows["year"].astype(int), rows["value"].astype(float)))
+
+
+def describe_plot(plot_request, df):
+    """A short narrative for a routed chart, computed from the data itself."""
+    plot_type, metric = plot_request["type"], plot_request["metric"]
+    if plot_type == "asset_liability_comparison":
+        assets, liabilities = dict(_series(df, "Total Assets")), dict(_series(df, "Total Liabilities"))
+        common = sorted(set(assets) & set(liabilities))
+        if not common:
+            return "Here is the comparison of total assets and total liabilities."
+        year = common[-1]
+        coverage = f" (assets cover liabilities {assets[year] / liabilities[year]:.2f}x)" if liabilities[year] else ""
+        return (f"In {year}, total assets were {assets[year]:,.2f} against total liabilities of "
+                f"{liabilities[year]:,.2f}{coverage}.")
+
+    series = _series(df, metric)
+    if not series:
+        return f"Here is the chart for {metric}."
+    if len(series) == 1:
+        return f"{metric} was {series[0][1]:,.2f} in {series[0][0]}; more years are needed to show a trend."
+    (first_year, first), (prev_year, prev), (last_year, last) = series[0], series[-2], series[-1]
+    if plot_type == "growth":
+        if prev == 0 or last_year - prev_year != 1:
+            return f"Here is the year-over-year growth of {metric}."
+        return f"{metric} changed by {(last - prev) / abs(prev) * 100:+.2f}% from {prev_year} to {last_year}."
+    change = f" ({(last - first) / abs(first) * 100:+.2f}%)" if first else ""
+    return f"{metric} moved from {first:,.2f} in {first_year} to {last:,.2f} in {last_year}{change}."
+
+
+def route_question(prompt, df, narrative=True):
+    """
+    Returns {"message", "plot_request"} when the prompt can be answered
+    locally, else None. Every call counts towards router_stats().
+    """
+    plot_request = parse_intent(prompt, set(df["metric"].unique()))
+    with _stats_lock:
+        _stats["routed" if plot_request else "passed"] += 1
+    if plot_request is None:
+        return None
+    message = describe_plot(plot_request, df) if narrative else None
+    return {"message": message, "plot_request": plot_request}
+
+
+def router_stats():
+    """Questions answered locally versus passed on to the model, and the hit rate."""
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats["routed"] + stats["passed"]
+    stats["hit_rate"] = stats["routed"] / total if total else 0.0
+    return stats
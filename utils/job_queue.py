@@ -0,0 +1,61 @@
+# utils/job_queue.py
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.database import get_or_create_ingest_job, update_ingest_job, fail_interrupted_ingest_jobs
+from utils.ingestion import run_ingest_job, file_sha256
+
+# Process-wide background queue for report uploads. Streamlit reruns page
+# scripts, but this module is imported once per server process, so every
+# session shares the same bounded pool of workers.
+
+# Reports processed at the same time; the rest wait in the queue. Each job
+# already runs several Groq requests in parallel, so keep this small.
+MAX_CONCURRENT_JOBS = 2
+
+_executor = None
+_lock = threading.Lock()
+_active = {}      # job id -> Future, for jobs queued or running in this process
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Anything still queued or running belongs to a previous server process.
+            fail_interrupted_ingest_jobs("upload", "Interrupted by a server restart. Please upload the report again.")
+            _executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="ingest")
+        return _executor
+
+
+def _run(job_id, pdf_path, company_id, year, source_document, delete_after):
+    try:
+        return run_ingest_job(job_id, pdf_path, company_id, year, source_document)
+    finally:
+        if delete_after and os.path.exists(pdf_path):
+            os.remove(pdf_path)
+        with _lock:
+            _active.pop(job_id, None)
+
+
+def submit_ingest_job(pdf_path, company_id, year, source_document, submitted_by=None, delete_after=True):
+    """
+    Queues a saved PDF for ingestion and returns its ingest_jobs id straight
+    away. If the same document is already queued or running for this company
+    and year, the existing job id is returned instead of queueing it twice.
+    """
+    executor = _get_executor()
+    job = get_or_create_ingest_job(pdf_path, file_sha256(pdf_path), company_id, year, "upload", submitted_by)
+
+    with _lock:
+        if job["id"] in _active:
+            # The running job reads its own copy; this duplicate upload is not needed.
+            if delete_after and pdf_path != job["file_path"] and os.path.exists(pdf_path):
+                os.remove(pdf_path)
+            return job["id"]
+        update_ingest_job(job["id"], status="queued", file_path=pdf_path, source_document=source_document, submitted_by=submitted_by, created_at=time.time(),
+                          started_at=None, finished_at=None, error=None, pages_done=0, llm_calls=0, keys_filled=0)
+        _active[job["id"]] = executor.submit(_run, job["id"], pdf_path, company_id, year, source_document, delete_after)
+    return job["id"]
+
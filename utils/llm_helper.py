@@ -1,16 +1,31 @@
 
 import os
+import heapq
 import json
 import re  
-from groq import Groq
-import pandas as pd
-
-# IMPORTANT: Ensure all your plotting functions are imported
-from utils.plotting import (
-    create_line_chart, 
-    create_bar_chart, 
-    create_asset_liability_chart,
-    create_growth_chart
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from utils.statement_parser import parse_statement_page, is_statement_page, detect_unit_scale, UNSCALED_KEYS
+from utils.answer_cache import is_cacheable_question, get_cached_answer, store_answer
+from utils.intent_router import route_question
+from utils.chat_context import (
+    compact_history, estimate_tokens, message_tokens, CHAT_MODEL, CONTEXT_WINDOW_TOKENS, MESSAGE_OVERHEAD_TOKENS,
+    RESPONSE_RESERVE_TOKENS
+)
+from utils.telemetry import span, record_span
+from utils.groq_gateway import complete, RequestCancelled, PRIORITY_CHAT, PRIORITY_INGEST
+from utils.page_filter import select_candidate_pages, score_page, DEFAULT_TOP_N, STREAM_MIN_SCORE
+from utils.page_packer import WindowPacker, pack_pages, continues_run, estimate_text_tokens
+from utils.extraction_cache import (
+    make_cache_key,
+    get_cached_extraction,
+    store_extraction,
+    evict_extraction_cache,
+    extraction_cache_stats
 )
 
 # ... (REQUIRED_KEYS and groq_client initialization remain the same) ...
@@ -20,55 +35,186 @@ REQUIRED_KEYS = [
     "Non-current assets", "Current assets", "Non-current liabilities",
     "Current liabilities", "Cash and cash equivalents", "Earnings Per Share (Basic)"
 ]
-groq_client = Groq()
+# The Groq client (and the groq package) is created on first use, so
+# importing this module stays cheap; see get_groq_client(). Requests go
+# through utils.groq_gateway, which owns rate limiting and retries.
+groq_client = None
+_groq_client_lock = threading.Lock()
 
-# --- FUNCTION 1: DATA EXTRACTION (Replaces structure_data_with_gemini) ---
-def structure_data_with_groq(text, year):
+
+def get_groq_client():
+    """Returns the shared Groq client, creating it on the first call."""
+    global groq_client
+    if groq_client is None:
+        with _groq_client_lock:
+            if groq_client is None:
+                from groq import Groq
+                # Retries are left to utils.groq_gateway, which knows about the shared quota.
+                groq_client = Groq(max_retries=0)
+    return groq_client
+
+def _token_usage(usage, messages, response_text):
     """
-    Extracts structured financial data from text using a Groq model.
+    Span fields for one completion: the API's reported usage when present,
+    else estimates from utils.chat_context (marked tokens_estimated).
     """
-    # Llama 3 8B is extremely fast and great for structured data extraction.
-    model_name = "llama3-8b-8192"
+    if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+        return {"prompt_tokens": usage.prompt_tokens, "completion_tokens": usage.completion_tokens}
+    return {"prompt_tokens": sum(message_tokens(message) for message in messages),
+            "completion_tokens": estimate_tokens(response_text), "tokens_estimated": True}
+
+# Llama 3 8B is extremely fast and great for structured data extraction.
+EXTRACTION_MODEL = "llama3-8b-8192"
+# Bump whenever the extraction prompt or the handling of its answer changes so cached results are not reused.
+EXTRACTION_PROMPT_VERSION = "4"
+# Room for the JSON answer (values plus their source pages); also passed as max_tokens.
+EXTRACTION_RESPONSE_TOKENS = 768
+# Header line opening each page (or part of a page) in an extraction window; see utils.page_packer.
+_PAGE_MARKER = re.compile(r"^--- PAGE (\d+)[^\n]*---$", re.MULTILINE)
 
+# Number of window requests allowed in flight at once during PDF processing.
+DEFAULT_MAX_WORKERS = 4
+# How many parsed pages may wait for the LLM stage when pages are streamed.
+STREAM_PREFETCH_PAGES = 16
+
+def _extraction_messages(text, year, keys):
+    """The extraction request for a window of one or more report pages."""
     prompt = f"""
-    Analyze the following text from a single page of a financial report for the year {year}.
+    Analyze the following pages of a financial report for the year {year}. Each page starts with a "--- PAGE n ---" line.
     Your task is to extract the specified financial metrics.
 
     Follow these rules strictly:
     1.  Return ONLY a single, valid JSON object. Do not include any other text, explanations, or markdown.
-    2.  The JSON object must contain these exact keys: {', '.join(REQUIRED_KEYS)}.
+    2.  The JSON object must contain these exact keys: {', '.join(keys)}.
     3.  Be flexible with labels: "Revenue from Operations" might appear as "Income from sales" or similar variations. Map them correctly.
-    4.  If a value for a specific key cannot be found ON THIS PAGE, the value in the JSON must be `null`. Do not guess or make up values.
+    4.  If a value for a specific key cannot be found IN THESE PAGES, the value in the JSON must be `null`. Do not guess or make up values.
     5.  All numerical values must be in a raw number format (e.g., 123456.78). Remove all commas, currency symbols, and text like "Cr.".
     6.  Pay close attention to negative numbers, often in parentheses, e.g., (123.45). Convert them to negative numbers, e.g., -123.45.
     7.  The report might be for a consolidated or standalone entity. Extract the data that is most prominently displayed.
+    8.  A statement may continue from one page onto the next; read it as one table.
+    9.  Also include a "source_pages" object mapping each non-null metric to the PAGE number it was read from, e.g. {{"Total Assets": 12}}.
 
-    Financial Report Page Text:
+    Financial Report Pages:
     ---
     {text}
     ---
     """
+    return [
+        {"role": "system", "content": "You are a highly accurate data extraction bot. Your only output should be a single, valid JSON object based on the user's request."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+# Page text allowed per extraction request: the model's window less the
+# instructions (with every key listed) and the answer.
+EXTRACTION_WINDOW_TOKENS = (
+    CONTEXT_WINDOW_TOKENS - EXTRACTION_RESPONSE_TOKENS
+    - sum(estimate_text_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in _extraction_messages("", 9999, REQUIRED_KEYS))
+)
+
+def _page_unit_scales(text):
+    """
+    {page_number: crore multiplier} for each page of an extraction window.
+    A page that declares no unit takes the one of the page right before it
+    (a statement carried over a page break), otherwise crore.
+    """
+    parts = _PAGE_MARKER.split(text)
+    scales = {}
+    previous = None
+    for number, body in zip(parts[1::2], parts[2::2]):
+        number = int(number)
+        if number in scales:
+            # A later part of a split page keeps the unit of its first part.
+            continue
+        scale = detect_unit_scale(body, default=None)
+        if scale is None:
+            scale = scales[previous] if previous == number - 1 else 1.0
+        scales[number] = scale
+        previous = number
+    return scales
 
+
+def _scale_to_crore(data, text):
+    """
+    Rescales the model's figures (returned as printed) to crore like the
+    local parser does, using the unit of the page each value came from.
+    A value whose page is unknown in a window of mixed units is dropped
+    rather than stored in the wrong unit.
+    """
+    source_pages = data.pop("source_pages", None)
+    if not isinstance(source_pages, dict):
+        source_pages = {}
+    scales = _page_unit_scales(text) or {None: detect_unit_scale(text)}
+    window_scale = next(iter(scales.values())) if len(set(scales.values())) == 1 else None
+    for key, value in data.items():
+        if key in UNSCALED_KEYS or not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        try:
+            scale = scales.get(int(source_pages.get(key)), window_scale)
+        except (TypeError, ValueError):
+            scale = window_scale
+        if scale is None:
+            print(f"Dropping {key}: its page is unknown and the window mixes units.")
+            data[key] = None
+        elif scale != 1.0:
+            data[key] = round(value * scale, 4)
+
+
+# --- FUNCTION 1: DATA EXTRACTION (Replaces structure_data_with_gemini) ---
+def structure_data_with_groq(text, year, keys=None, cancelled=None, on_send=None):
+    """
+    Extracts structured financial data from text using a Groq model.
+    Successful results are cached by content, so unchanged pages are free.
+    Pass keys to ask only for a subset of REQUIRED_KEYS.
+
+    If the cancelled event is set before the request leaves the gateway,
+    nothing is sent and None is returned. on_send() is called when the
+    request is actually sent (not for cache hits).
+    """
+    model_name = EXTRACTION_MODEL
+    keys = list(keys) if keys else REQUIRED_KEYS
+
+    prompt_version = EXTRACTION_PROMPT_VERSION
+    if keys != REQUIRED_KEYS:
+        prompt_version += ":" + "|".join(keys)
+    cache_key = make_cache_key(text, year, model_name, prompt_version)
+    cached = get_cached_extraction(cache_key)
+    if cached is not None:
+        return cached
+
+    messages = _extraction_messages(text, year, keys)
     try:
-        response = groq_client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": "You are a highly accurate data extraction bot. Your only output should be a single, valid JSON object based on the user's request."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.0, # Lower temperature for factual tasks
-            response_format={"type": "json_object"} # This forces the model to output valid JSON
-        )
-        # The response is now in a standard format
-        json_str = response.choices[0].message.content
-        data = json.loads(json_str)
-
-        # Ensure all required keys are present, even if null
-        for key in REQUIRED_KEYS:
-            if key not in data:
-                data[key] = None
-
-        return data
+        with span("llm_call", kind="extraction", model=model_name, year=year, keys=len(keys)) as call:
+            try:
+                response = complete(
+                    get_groq_client(), PRIORITY_INGEST,
+                    on_retry=lambda attempt, error: call.set(retries=attempt),
+                    estimated_tokens=sum(estimate_text_tokens(m["content"]) for m in messages) + EXTRACTION_RESPONSE_TOKENS,
+                    cancelled=cancelled,
+                    on_send=on_send,
+                    model=model_name,
+                    messages=messages,
+                    temperature=0.0, # Lower temperature for factual tasks
+                    max_tokens=EXTRACTION_RESPONSE_TOKENS,
+                    response_format={"type": "json_object"} # This forces the model to output valid JSON
+                )
+            except RequestCancelled:
+                call.set(cancelled=True)
+                return None
+            # The response is now in a standard format
+            json_str = response.choices[0].message.content
+            call.set(**_token_usage(getattr(response, "usage", None), messages, json_str))
+
+        with span("json_parse", kind="extraction", chars=len(json_str or "")):
+            data = json.loads(json_str)
+
+            # Ensure all required keys are present, even if null
+            for key in REQUIRED_KEYS:
+                if key not in data:
+                    data[key] = None
+
+            _scale_to_crore(data, text)
+
     except Exception as e:
         print(f"Error during Groq extraction or JSON parsing: {e}")
         # Add the response content to the error if it exists for debugging
@@ -77,28 +223,362 @@ def structure_data_with_groq(text, year):
             response_text = response.choices[0].message.content
         return {"error": f"JSON parsing failed: {str(e)}", "details": response_text}
 
+    # The answer is already paid for; a busy cache must not turn it into an error.
+    try:
+        store_extraction(cache_key, model_name, prompt_version, data)
+    except sqlite3.Error as e:
+        print(f"Error caching Groq extraction: {e}")
+    return data
+
 
 # --- FUNCTION 2: PDF PROCESSING (Minor change) ---
-def process_pdf_pages(pages, year):
+def _merge_extracted(final_data, extracted_data):
+    """Fills empty slots in final_data from one page result (first non-null wins)."""
+    if "error" not in extracted_data:
+        for key, value in extracted_data.items():
+            if final_data.get(key) is None and value is not None:
+                final_data[key] = value
+
+
+def _all_keys_filled(final_data):
+    return all(final_data.get(key) is not None for key in REQUIRED_KEYS)
+
+
+def _numbered(pages):
+    """Yields (page_number, text) from a list of texts or of (page_number, text) tuples."""
+    for index, item in enumerate(pages):
+        if isinstance(item, tuple):
+            yield item
+        else:
+            yield index + 1, item
+
+
+def _ranked_windows(pages, top_n, report, on_page):
+    """
+    Yields (page_number, text) windows packing the top_n ranked pages of a
+    complete list (see utils.page_packer). on_page(page_number, text) runs
+    on every selected page before the first window is yielded, so the local
+    pass sees all candidates up front.
+    """
+    numbered = list(_numbered(pages))
+    texts = [text for _, text in numbered]
+    if top_n is None:
+        selected = range(len(texts))
+        report.update({"pages_total": len(texts), "pages_selected": len(texts), "llm_calls_saved": 0, "scores": {}})
+    else:
+        selected, rank_report = select_candidate_pages(texts, top_n)
+        rank_report["scores"] = {numbered[k - 1][0]: v for k, v in rank_report["scores"].items()}
+        report.update(rank_report)
+
+    for i in selected:
+        on_page(numbered[i][0], texts[i])
+    windows = pack_pages(numbered, selected, EXTRACTION_WINDOW_TOKENS)
+    report["windows"] = len(windows)
+    report["pages_packed"] = len({number for window in windows for number in window[2]})
+    for first_page, text, _ in windows:
+        yield first_page, text
+
+
+def _streamed_windows(pages, top_n, report, cancelled, on_page, on_seen):
+    """
+    Yields (page_number, text) windows of relevant pages while the document
+    is still being parsed. A producer thread drains the page iterator into a
+    bounded queue, so parsing runs ahead of the LLM stage by at most
+    STREAM_PREFETCH_PAGES pages.
+
+    A page titled as a primary statement (is_statement_page) that clears
+    STREAM_MIN_SCORE is packed at once, with any untitled page its table
+    runs onto, and a window goes out as soon as it is full. Every other
+    scoring page competes for the rest of the top_n budget in a running
+    top-N, which is only packed once the whole document has been seen.
+    """
+    buffer = queue.Queue(maxsize=STREAM_PREFETCH_PAGES)
+    end_of_pages = object()
+    stop = threading.Event()
+    failure = []      # an error from the page iterator, raised again on this side
+
+    def put(item):
+        while not (stop.is_set() or cancelled.is_set()):
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in _numbered(pages):
+                if not put(item):
+                    return
+        except Exception as e:
+            print(f"Error while streaming pages: {e}")
+            failure.append(e)
+        finally:
+            # Stop the parser (and its process pool) now rather than at garbage collection.
+            close = getattr(pages, "close", None)
+            if close is not None:
+                close()
+        put(end_of_pages)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+
+    limit = top_n if top_n is not None else float("inf")
+    seen = 0
+    scores = {}
+    packer = WindowPacker(EXTRACTION_WINDOW_TOKENS)
+    run = []          # consecutive statement pages waiting to be packed
+    immediate = 0     # pages packed as they arrived
+    deferred = []     # min-heap of (score, -page_number, run) for the rest of the budget
+    open_run = None   # the run the next page may continue: run or a deferred one
+    packed_pages = set()
+    windows = 0
+
+    def packed(completed):
+        nonlocal windows
+        for first_page, text, page_numbers in completed:
+            windows += 1
+            packed_pages.update(page_numbers)
+            yield first_page, text
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is end_of_pages:
+                if failure:
+                    raise failure[0]
+                break
+            seen += 1
+            on_seen(seen)
+            page_number, text = item
+            score = score_page(text)
+            follows = open_run is not None and page_number == open_run[-1][0] + 1
+
+            if score > 0 and (top_n is None or (score >= STREAM_MIN_SCORE and is_statement_page(text))):
+                scores[page_number] = round(score, 2)
+                on_page(page_number, text)
+                immediate += 1
+                if run and not (follows and open_run is run):
+                    yield from packed(packer.add_run(run))
+                    run = []
+                run.append(item)
+                open_run = run
+                while deferred and immediate + len(deferred) > limit:
+                    heapq.heappop(deferred)
+                if immediate >= limit:
+                    # The budget is spent on statements, so stop parsing the rest.
+                    break
+                continue
+
+            if follows and continues_run(open_run, text):
+                # An untitled page carrying on the statement before it.
+                open_run.append(item)
+                continue
+            if run:
+                yield from packed(packer.add_run(run))
+                run = []
+            open_run = None
+            if score > 0 and immediate < limit:
+                candidate = [item]
+                heapq.heappush(deferred, (score, -page_number, candidate))
+                if immediate + len(deferred) > limit:
+                    heapq.heappop(deferred)
+                open_run = candidate
+
+        if run:
+            yield from packed(packer.add_run(run))
+        # The rest of the budget goes to the best of the other pages, grouped into consecutive runs.
+        chosen = sorted(deferred, key=lambda entry: -entry[1])
+        tail = []
+        for score, negative_page, candidate in chosen:
+            scores[-negative_page] = round(score, 2)
+            on_page(*candidate[0])
+            if tail and candidate[0][0] != tail[-1][0] + 1:
+                yield from packed(packer.add_run(tail))
+                tail = []
+            tail += candidate
+        if tail:
+            yield from packed(packer.add_run(tail))
+        yield from packed(packer.finish())
+    finally:
+        stop.set()
+        producer.join()
+        report.update({
+            "pages_total": seen,
+            "pages_selected": len(scores),
+            "llm_calls_saved": seen - len(scores),
+            "scores": scores,
+            "windows": windows,
+            "pages_packed": len(packed_pages),
+        })
+
+
+def _extract_window(text, year, keys, cancelled, on_send):
+    """Worker task: sends one window of text to Groq unless work was cancelled."""
+    if cancelled.is_set():
+        return None
+    return structure_data_with_groq(text, year, keys, cancelled=cancelled, on_send=on_send)
+
+
+def process_pdf_pages(pages, year, top_n=DEFAULT_TOP_N, stats=None, max_workers=DEFAULT_MAX_WORKERS,
+                      pdf_path=None, use_local=True, on_progress=None):
     """
     Processes a PDF page by page, intelligently merging the results.
+    Only the top_n pages ranked by utils.page_filter are sent to the LLM;
+    pass top_n=None to send every page. If a stats dict is given, it is
+    filled with the relevance report (pages selected, windows, LLM calls).
+
+    Selected pages are packed by utils.page_packer into windows that fit
+    EXTRACTION_WINDOW_TOKENS, one request each; a statement running onto
+    an untitled next page stays in one window. Up to max_workers windows
+    are in flight at once. Results are merged in page order, and
+    outstanding work is cancelled once every key is filled.
+
+    pages may be a list of page texts, a list of (page_number, text) tuples,
+    or an iterator such as extract_pages_from_pdf(..., stream=True). An
+    iterator is consumed as pages arrive, so parsing overlaps with LLM calls:
+    statement pages are sent as they arrive and the rest of the top_n budget
+    goes to the best remaining pages at the end (see _streamed_windows).
+    An error raised by the iterator, such as an unreadable PDF, is raised
+    again here so the caller can record it.
+
+    With use_local=True, candidate statement pages are first read by the
+    deterministic parser in utils.statement_parser (using word geometry from
+    pdf_path when given), and Groq is only asked for keys it left empty.
+
+    on_progress, if given, is called with a dict of pages_done, llm_calls and
+    keys_filled whenever one of them changes.
     """
     final_data = {key: None for key in REQUIRED_KEYS}
+    evict_extraction_cache()
+    cache_before = extraction_cache_stats()
 
-    for i, page_text in enumerate(pages):
-        print(f"Processing page {i + 1}/{len(pages)}...")
-        combined_text = page_text
-        if i + 1 < len(pages):
-            combined_text += "\n\n--- NEXT PAGE CONTEXT ---\n\n" + pages[i+1]
-        
-        # We limit context, but Llama3 8B has an 8K token window, so we can be generous.
-        # CHANGED: Call the new Groq function
-        extracted_data = structure_data_with_groq(combined_text[:30000], year)
-
-        if "error" not in extracted_data:
-            for key, value in extracted_data.items():
-                if final_data.get(key) is None and value is not None:
-                    final_data[key] = value
+    report = {}
+    results = {}          # candidate position -> extracted data, waiting to be merged
+    next_to_merge = 0
+    submitted = 0         # windows handed to the workers
+    dispatched = 0        # requests that actually went out to Groq
+    dispatched_lock = threading.Lock()
+    pending = {}
+    cancelled = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+
+    local_keys = []
+    merge_seconds = 0.0
+    # Streamed pages are counted as they arrive; a list is all there from the start.
+    pages_done = len(pages) if isinstance(pages, (list, tuple)) else 0
+
+    def notify():
+        if on_progress is not None:
+            on_progress({
+                "pages_done": pages_done,
+                "llm_calls": dispatched,
+                "keys_filled": sum(1 for key in REQUIRED_KEYS if final_data.get(key) is not None),
+            })
+
+    def local_pass(page_number, text):
+        if not use_local or not is_statement_page(text):
+            return
+        if pdf_path:
+            from utils.pdf_processor import extract_page_words
+            words = extract_page_words(pdf_path, page_number)
+        else:
+            words = None
+        for key, value in parse_statement_page(text, year, words).items():
+            if final_data.get(key) is None:
+                final_data[key] = value
+                local_keys.append(key)
+
+    def on_send():
+        nonlocal dispatched
+        with dispatched_lock:
+            dispatched += 1
+
+    def on_seen(count):
+        nonlocal pages_done
+        pages_done = count
+        notify()
+
+    if isinstance(pages, (list, tuple)):
+        windows = _ranked_windows(pages, top_n, report, local_pass)
+    else:
+        windows = _streamed_windows(pages, top_n, report, cancelled, local_pass, on_seen)
+
+    def submit_next():
+        nonlocal submitted
+        if cancelled.is_set():
+            return
+        window = next(windows, None)
+        if window is None:
+            return
+        missing = [key for key in REQUIRED_KEYS if final_data.get(key) is None]
+        if not missing:
+            cancelled.set()
+            return
+        page_number, text = window
+        print(f"Processing window from page {page_number} (request {submitted + 1}, {len(missing)} keys missing)...")
+        future = executor.submit(_extract_window, text, year, missing, cancelled, on_send)
+        pending[future] = (submitted, page_number)
+        submitted += 1
+
+    try:
+        # Only max_workers requests are ever queued, so early termination
+        # leaves nothing behind in the executor.
+        for _ in range(max(1, max_workers)):
+            submit_next()
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                position, page_number = pending.pop(future)
+                try:
+                    results[position] = future.result() or {}
+                except Exception as e:
+                    print(f"Error processing page {page_number}: {e}")
+                    results[position] = {}
+
+            # Merge strictly in page order so earlier pages keep priority.
+            merge_started = time.perf_counter()
+            while next_to_merge in results:
+                _merge_extracted(final_data, results.pop(next_to_merge))
+                next_to_merge += 1
+            merge_seconds += time.perf_counter() - merge_started
+            notify()
+
+            if _all_keys_filled(final_data):
+                print(f"All required keys filled after {next_to_merge} pages; cancelling remaining work.")
+                cancelled.set()
+                for future in pending:
+                    future.cancel()
+                break
+
+            for _ in range(len(done)):
+                submit_next()
+    finally:
+        cancelled.set()
+        windows.close()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # Workers still queued at the gate see the event and send nothing.
+    with dispatched_lock:
+        llm_calls = dispatched
+    print(f"Page filter: packed {report.get('pages_packed', 0)}/{report.get('pages_total', 0)} pages into "
+          f"{report.get('windows', 0)} windows; sent {llm_calls} of them to the LLM.")
+    if local_keys:
+        print(f"Local statement parser filled {len(local_keys)}/{len(REQUIRED_KEYS)} keys without the LLM.")
+    report["local_keys"] = local_keys
+    report["llm_calls_dispatched"] = llm_calls
+    report["llm_calls_skipped_early"] = report.get("windows", 0) - submitted
+    cache_after = extraction_cache_stats()
+    report["cache_hits"] = cache_after["hits"] - cache_before["hits"]
+    report["cache_misses"] = cache_after["misses"] - cache_before["misses"]
+    # Each merge step takes microseconds, so the document gets one span with their total.
+    record_span("merge", merge_seconds, windows=next_to_merge, llm_calls=llm_calls, local_keys=len(local_keys),
+                keys_filled=sum(1 for key in REQUIRED_KEYS if final_data.get(key) is not None))
+    if stats is not None:
+        stats.update(report)
+    notify()
 
     if all(value is None for value in final_data.values()):
         return {"error": "Could not extract any required financial data. The document might not be a financial report, or the data is in a format the AI could not read."}
@@ -106,9 +586,10 @@ def process_pdf_pages(pages, year):
     return final_data
 
 # --- FUNCTION 3: CONVERSATIONAL AGENT SETUP (UPDATED PROMPT) ---
-def get_initial_chat_messages(company_name, data_summary):
+def get_initial_chat_messages(company_name, data_summary, ratio_summary=None):
     """
-    Creates a more forceful and clearer system prompt.
+    Creates a more forceful and clearer system prompt. ratio_summary, when
+    given, is the precomputed ratio table from utils.ratios.
     """
     # --- SOLUTION: A stronger, more direct prompt ---
     system_prompt = f"""
@@ -132,43 +613,59 @@ def get_initial_chat_messages(company_name, data_summary):
     - Use the "growth" type for any "year-over-year growth" or "growth rate" questions.
     - If no plot is needed, respond with plain text only.
 
-    Available Financial Data:
+    Available Financial Data (CSV, one row per metric and unit; the "unit" column gives each row's unit. Figures marked "unit not recorded" come from older uploads of unknown scale: quote them as stored and never compare or combine them with Rs crore figures):
     ---
     {data_summary}
     ---
     """
+    if ratio_summary:
+        system_prompt += f"""
+    Key Ratios (CSV, precomputed from the data above; quote these instead of recalculating):
+    ---
+    {ratio_summary}
+    ---
+    """
     chat_history = [{"role": "system", "content": system_prompt}]
     return chat_history
 
 
-# --- FUNCTION 4: GETTING A RESPONSE (ROBUST PARSING) ---
-def get_groq_response(chat_history, prompt, df):
+_PARTIAL_MESSAGE_FIELD = re.compile(r'"message"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+
+def streaming_preview(partial_text):
     """
-    Gets a response from Groq with robust JSON parsing for plots.
+    Text to show while a reply is still streaming. Plain replies are shown
+    as they arrive; for a JSON plot reply only its "message" field is shown,
+    so the user never sees half-written JSON.
     """
-    model_name = "llama3-8b-8192" 
-    chat_history.append({"role": "user", "content": prompt})
-
+    start = partial_text.find("{")
+    if start == -1:
+        return partial_text
+    prefix = re.sub(r"```(?:json)?\s*$", "", partial_text[:start]).strip()
+    match = _PARTIAL_MESSAGE_FIELD.search(partial_text, start)
+    if not match:
+        return prefix
     try:
-        response = groq_client.chat.completions.create(
-            model=model_name,
-            messages=chat_history,
-            temperature=0.1, # Keep temperature low for reliable tool use
-        )
-        response_text = response.choices[0].message.content
-        
-        # --- IMPORTANT: Add this for debugging! ---
-        print("\n--- RAW AI RESPONSE ---\n")
-        print(response_text)
-        print("\n--- END RAW AI RESPONSE ---\n")
-        
-        chat_history.append({"role": "assistant", "content": response_text})
+        message = json.loads(f'"{match.group(1)}"')
+    except ValueError:
+        # An escape sequence cut off mid-stream; show it raw until it completes.
+        message = match.group(1)
+    return f"{prefix}\n\n{message}" if prefix else message
+
+
+def _plot_for(plot_request, df, company_id=None):
+    """The figure for a plot request, memoized per company data version when company_id is known."""
+    # Imported here: plotly is only needed once a chart is actually drawn.
+    if company_id is None:
+        from utils.plotting import build_plot_figure
+        return build_plot_figure(plot_request, df)
+    from utils.data_cache import cached_figure
+    return cached_figure(company_id, plot_request, lambda: df)
 
-    except Exception as e:
-        print(f"Error getting response from Groq: {e}")
-        return {"message": "Sorry, I encountered an error connecting to the AI model.", "plot": None}, chat_history
 
-    final_response = {"message": None, "plot": None}
+def _parse_chat_response(response_text):
+    """Splits a complete reply into its message text and, if requested, a plot request."""
+    final_response = {"message": None, "plot_request": None}
     
     # --- SOLUTION: Robust JSON extraction logic ---
     try:
@@ -185,23 +682,7 @@ def get_groq_response(chat_history, prompt, df):
                 plot_info = request_data.get("plot_request")
 
                 if plot_info:
-                    plot_type = plot_info.get("type")
-                    metric = plot_info.get("metric")
-                    title = plot_info.get("title")
-
-                    # The rest of your plotting logic is perfect.
-                    if plot_type in ["line", "bar"] and metric and metric in df['metric'].unique():
-                        plot_df = df[df['metric'] == metric].sort_values('year')
-                        if plot_type == "line":
-                            final_response["plot"] = create_line_chart(plot_df, 'year', 'value', title)
-                        else:
-                            final_response["plot"] = create_bar_chart(plot_df, 'year', 'value', title)
-                    
-                    elif plot_type == "asset_liability_comparison":
-                        final_response["plot"] = create_asset_liability_chart(df)
-                    
-                    elif plot_type == "growth" and metric and metric in df['metric'].unique():
-                        final_response["plot"] = create_growth_chart(df, metric, title)
+                    final_response["plot_request"] = plot_info
             else:
                 # Could not find a JSON block, so treat it as plain text.
                  final_response["message"] = response_text
@@ -214,4 +695,107 @@ def get_groq_response(chat_history, prompt, df):
         print(f"Error during plot processing. Displaying raw text. Error: {e}")
         final_response["message"] = response_text
 
-    return final_response, chat_history
\ No newline at end of file
+    return final_response
+
+
+# --- FUNCTION 4: GETTING A RESPONSE (ROBUST PARSING) ---
+def get_groq_response(chat_history, prompt, df, on_token=None, company_id=None, data_version=None):
+    """
+    Gets a response from Groq with robust JSON parsing for plots. The full
+    chat_history is kept, but only the system prompt and the most recent
+    turns that fit the token budget are sent (see utils.chat_context).
+
+    With on_token, the completion is streamed and on_token(text_so_far) is
+    called as each piece arrives; the plot request is parsed once the
+    stream ends. The result carries ttft_seconds and total_seconds.
+
+    Unambiguous chart requests are answered by utils.intent_router without
+    a model call ("routed": True). With company_id, first-turn and
+    self-contained questions are answered from utils.answer_cache when
+    possible ("cached": True); data_version is the company's data version
+    the system prompt in chat_history was built from.
+
+    Each call is recorded as a "chat_turn" span (utils.telemetry) with its
+    route, time to first token and token counts.
+    """
+    model_name = CHAT_MODEL
+    cacheable = company_id is not None and is_cacheable_question(chat_history, prompt)
+    chat_history.append({"role": "user", "content": prompt})
+    started = time.perf_counter()
+    ttft = None
+
+    with span("chat_turn", company_id=company_id, streamed=on_token is not None) as turn:
+        # Plain chart requests are answered locally; the turn is recorded in the
+        # same JSON shape the model uses so later turns read naturally.
+        routed = route_question(prompt, df)
+        if routed is not None:
+            turn.set(route="local")
+            chat_history.append({"role": "assistant", "content": json.dumps(routed)})
+            final_response = {"message": routed["message"], "plot_request": routed["plot_request"],
+                              "plot": _plot_for(routed["plot_request"], df, company_id), "routed": True}
+            if on_token is not None and routed["message"]:
+                on_token(routed["message"])
+            final_response["ttft_seconds"] = final_response["total_seconds"] = time.perf_counter() - started
+            return final_response, chat_history
+
+        cached = get_cached_answer(company_id, prompt, data_version) if cacheable else None
+        if cached is not None:
+            turn.set(route="cache")
+            chat_history.append({"role": "assistant", "content": cached["response_text"]})
+            final_response = {"message": cached["message"], "plot": None, "cached": True}
+            if cached["plot_request"]:
+                final_response["plot_request"] = cached["plot_request"]
+                final_response["plot"] = _plot_for(cached["plot_request"], df, company_id)
+            if on_token is not None and cached["message"]:
+                on_token(cached["message"])
+            final_response["ttft_seconds"] = final_response["total_seconds"] = time.perf_counter() - started
+            return final_response, chat_history
+
+        turn.set(route="model", model=model_name)
+        messages = compact_history(chat_history)
+        usage = None
+        try:
+            response = complete(
+                get_groq_client(), PRIORITY_CHAT,
+                on_retry=lambda attempt, error: turn.set(retries=attempt),
+                model=model_name,
+                messages=messages,
+                temperature=0.1, # Keep temperature low for reliable tool use
+                max_tokens=RESPONSE_RESERVE_TOKENS,
+                stream=on_token is not None,
+            )
+            if on_token is None:
+                response_text = response.choices[0].message.content
+                usage = getattr(response, "usage", None)
+                ttft = time.perf_counter() - started
+            else:
+                pieces = []
+                for chunk in response:
+                    # Groq reports usage for a stream on its final chunk.
+                    usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    pieces.append(delta)
+                    on_token("".join(pieces))
+                response_text = "".join(pieces)
+
+            chat_history.append({"role": "assistant", "content": response_text})
+
+        except Exception as e:
+            print(f"Error getting response from Groq: {e}")
+            turn.set(status="error", error=type(e).__name__)
+            return {"message": "Sorry, I encountered an error connecting to the AI model.", "plot": None}, chat_history
+
+        turn.set(ttft_seconds=ttft, response_chars=len(response_text), **_token_usage(usage, messages, response_text))
+        with span("json_parse", kind="chat", chars=len(response_text)):
+            final_response = _parse_chat_response(response_text)
+        final_response["plot"] = _plot_for(final_response["plot_request"], df, company_id) if final_response["plot_request"] else None
+        if cacheable and final_response["message"]:
+            store_answer(company_id, prompt, response_text, final_response["message"], final_response.get("plot_request"),
+                         data_version)
+        final_response["ttft_seconds"] = ttft
+        final_response["total_seconds"] = time.perf_counter() - started
+        return final_response, chat_history
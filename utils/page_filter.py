@@ -0,0 +1,114 @@
+# utils/page_filter.py
+import re
+
+# Only a handful of pages in an annual report hold the balance sheet and P&L.
+# This module scores every page locally so that only the most promising ones
+# are sent to the LLM.
+
+# Label variations seen in Schedule III statements, keyed by REQUIRED_KEYS.
+METRIC_SYNONYMS = {
+    "Revenue from Operations": ["revenue from operations", "income from operations", "revenue from sales", "sales", "turnover"],
+    "Other Income": ["other income"],
+    "Total Income": ["total income", "total revenue"],
+    "Profit Before Tax": ["profit before tax", "profit before taxation", "profit/(loss) before tax", "pbt"],
+    "Net Profit": ["profit for the year", "profit after tax", "net profit", "profit for the period"],
+    "Total Equity": ["total equity", "shareholders' funds", "equity attributable"],
+    "Total Assets": ["total assets"],
+    "Total Liabilities": ["total liabilities", "total equity and liabilities"],
+    "Non-current assets": ["non-current assets", "non current assets"],
+    "Current assets": ["current assets"],
+    "Non-current liabilities": ["non-current liabilities", "non current liabilities"],
+    "Current liabilities": ["current liabilities"],
+    "Cash and cash equivalents": ["cash and cash equivalents", "cash and bank balances"],
+    "Earnings Per Share (Basic)": ["earnings per share", "earnings per equity share", "basic (in"],
+}
+
+# Titles of the primary statements. A page carrying one of these is almost
+# certainly worth an LLM call.
+STATEMENT_HEADERS = [
+    "balance sheet",
+    "statement of profit and loss",
+    "profit and loss account",
+    "statement of assets and liabilities",
+    "cash flow statement",
+    "statement of cash flows",
+]
+
+# Pages that mention the metrics but rarely carry the statements themselves.
+PENALTY_HEADERS = [
+    "notes to the",
+    "independent auditor",
+    "directors' report",
+    "management discussion",
+    "corporate governance",
+]
+
+DEFAULT_TOP_N = 8
+# When pages are streamed, a page titled as a primary statement is sent as
+# soon as it clears this score rather than waiting for the whole document to
+# be ranked. Statement pages typically score 10+.
+STREAM_MIN_SCORE = 8.0
+
+# Numbers in Indian (1,46,635) and Western (146,635.00) formats, or in parentheses.
+NUMBER_PATTERN = re.compile(r"\(?-?\d{1,3}(?:,\d{2,3})+(?:\.\d+)?\)?|\(?-?\d+\.\d+\)?")
+
+
+def score_page(text):
+    """
+    Returns a relevance score for a single page of text. Higher means the page
+    is more likely to hold the REQUIRED_KEYS metrics.
+    """
+    if not text:
+        return 0.0
+
+    lowered = text.lower()
+    lines = [line for line in lowered.splitlines() if line.strip()]
+    if not lines:
+        return 0.0
+
+    # 1. Statement titles are the strongest signal.
+    header_hits = sum(1 for header in STATEMENT_HEADERS if header in lowered)
+
+    # 2. Count how many distinct metrics have at least one label on this page.
+    metric_hits = sum(
+        1 for synonyms in METRIC_SYNONYMS.values()
+        if any(synonym in lowered for synonym in synonyms)
+    )
+
+    # 3. Statements are dense tables: many lines end in formatted amounts.
+    numeric_lines = sum(1 for line in lines if NUMBER_PATTERN.search(line))
+    numeric_density = numeric_lines / len(lines)
+
+    penalty = sum(1 for header in PENALTY_HEADERS if header in lowered)
+
+    score = 4.0 * min(header_hits, 2) + 1.0 * metric_hits + 5.0 * numeric_density - 1.5 * penalty
+    return max(score, 0.0)
+
+
+def rank_pages(pages):
+    """
+    Scores every page and returns a list of (index, score) tuples, best first.
+    Pages that score zero are left out.
+    """
+    scored = [(i, score_page(text)) for i, text in enumerate(pages)]
+    scored = [item for item in scored if item[1] > 0]
+    # Ties keep document order so earlier statements win.
+    scored.sort(key=lambda item: (-item[1], item[0]))
+    return scored
+
+
+def select_candidate_pages(pages, top_n=DEFAULT_TOP_N):
+    """
+    Picks the top_n most relevant pages and returns their indexes in document
+    order, along with a small report of how many LLM calls were avoided.
+    """
+    ranked = rank_pages(pages)
+    selected = sorted(i for i, _ in ranked[:top_n])
+
+    report = {
+        "pages_total": len(pages),
+        "pages_selected": len(selected),
+        "llm_calls_saved": len(pages) - len(selected),
+        "scores": {i + 1: round(score, 2) for i, score in ranked[:top_n]},
+    }
+    return selected, report
@@ -0,0 +1,190 @@
+# utils/page_packer.py
+import math
+import re
+from utils.statement_parser import is_statement_page, is_continuation_page
+
+# Packs the pages chosen for the LLM into as few extraction requests as fit
+# the model's context window. Consecutive pages travel as one run, and a
+# statement page pulls in the untitled page its table runs onto, so a
+# balance sheet split over a page break is read in one request. Runs are
+# then packed whole into windows sized by estimated tokens; only a run too
+# large for one window is split, repeating a few lines across each break.
+
+# Lines of a page repeated at the top of the next window when a run is split.
+OVERLAP_TOKENS = 150
+# Untitled pages a statement may run onto.
+MAX_CONTINUATION_PAGES = 2
+# Tokens for the blank line between two pages of a window.
+SEPARATOR_TOKENS = 1
+# Room for a part header such as "--- PAGE 123 (part 2 of 3) ---" on a split page.
+PART_HEADER_TOKENS = 16
+
+# Statement pages are mostly numbers, which tokenize far worse than prose:
+# Llama 3 splits digits into groups of up to three and every comma, period
+# and parenthesis is its own token. Count those pieces rather than characters.
+_TOKEN_PIECES = re.compile(r"[^\W\d_]+|\d{1,3}|\S")
+
+
+def estimate_text_tokens(text):
+    """Token estimate for report text; errs on the high side for both prose and tables."""
+    return sum(math.ceil(len(piece) / 4) if piece[0].isalpha() else 1 for piece in _TOKEN_PIECES.findall(text or ""))
+
+
+def _page_block(page_number, text, label=""):
+    return f"--- PAGE {page_number}{label} ---\n{text}"
+
+
+def _tail(text, max_tokens):
+    """The last whole lines of text that fit in max_tokens."""
+    lines, used = [], 0
+    for line in reversed(text.splitlines()):
+        cost = estimate_text_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        lines.insert(0, line)
+        used += cost
+    return "\n".join(lines)
+
+
+def _split_lines(text, max_tokens):
+    """Cuts text into pieces of whole lines, each within max_tokens (an overlong line is cut by characters)."""
+    pieces, lines, used = [], [], 0
+    for line in text.splitlines():
+        cost = estimate_text_tokens(line) + 1
+        while cost > max_tokens:
+            # A single line longer than a window: cut it at the character estimate.
+            cut = max(1, len(line) * max_tokens // cost)
+            if lines:
+                pieces.append("\n".join(lines))
+                lines, used = [], 0
+            pieces.append(line[:cut])
+            line = line[cut:]
+            cost = estimate_text_tokens(line) + 1
+        if lines and used + cost > max_tokens:
+            pieces.append("\n".join(lines))
+            lines, used = [], 0
+        lines.append(line)
+        used += cost
+    if lines:
+        pieces.append("\n".join(lines))
+    return pieces
+
+
+def continues_run(run, text):
+    """True if text is the untitled second (or third) page of the statement ending run."""
+    if not is_continuation_page(text):
+        return False
+    trailing = 0
+    for _, previous in reversed(run):
+        if is_statement_page(previous):
+            return trailing < MAX_CONTINUATION_PAGES
+        if not is_continuation_page(previous):
+            return False
+        trailing += 1
+    return False
+
+
+def page_runs(numbered, selected):
+    """
+    Groups the selected indexes of numbered [(page_number, text), ...] into
+    runs of consecutive pages, each extended by any page its last statement
+    runs onto. Returns a list of runs, each a list of (page_number, text).
+    """
+    runs = []
+    included = set()
+    selected = sorted(set(selected))
+    chosen = set(selected)
+    for i in selected:
+        if i in included:
+            continue
+        if runs and i - 1 in included:
+            run = runs[-1]
+        else:
+            run = []
+            runs.append(run)
+        run.append(numbered[i])
+        included.add(i)
+        following = i + 1
+        while following < len(numbered) and following not in chosen and continues_run(run, numbered[following][1]):
+            run.append(numbered[following])
+            included.add(following)
+            following += 1
+    return runs
+
+
+class WindowPacker:
+    """
+    Packs runs into windows of at most budget estimated tokens. add_run()
+    returns the windows it completed and finish() the last partial one,
+    each as (first_page_number, text, page_numbers).
+    """
+
+    def __init__(self, budget, overlap=OVERLAP_TOKENS):
+        self.budget = budget
+        self.overlap = min(overlap, budget // 4)
+        self._parts = []
+        self._pages = []
+        self._used = 0
+
+    def _add(self, page_number, block, cost):
+        self._parts.append(block)
+        self._used += cost + SEPARATOR_TOKENS
+        if page_number not in self._pages:
+            self._pages.append(page_number)
+
+    def _close(self):
+        if not self._parts:
+            return []
+        window = (self._pages[0], "\n\n".join(self._parts), list(self._pages))
+        self._parts, self._pages, self._used = [], [], 0
+        return [window]
+
+    def _page_pieces(self, page_number, text):
+        """The page as one block, or as line-bounded parts when it cannot fit a window with an overlap."""
+        block = _page_block(page_number, text)
+        if estimate_text_tokens(block) <= self.budget:
+            return [block]
+        # Leave room for the part header and the lines carried over from the previous part.
+        parts = _split_lines(text, self.budget - self.overlap - PART_HEADER_TOKENS)
+        return [_page_block(page_number, part, f" (part {k} of {len(parts)})") for k, part in enumerate(parts, start=1)]
+
+    def add_run(self, run):
+        blocks = [(page_number, _page_block(page_number, text)) for page_number, text in run]
+        cost = sum(estimate_text_tokens(block) + SEPARATOR_TOKENS for _, block in blocks)
+        completed = []
+        if self._used + cost > self.budget:
+            completed += self._close()
+        if cost <= self.budget:
+            for page_number, block in blocks:
+                self._add(page_number, block, estimate_text_tokens(block))
+            return completed
+
+        # The run alone is larger than a window: fill page by page, and start
+        # each new window with the closing lines of the previous one.
+        previous = None
+        for page_number, text in run:
+            for piece in self._page_pieces(page_number, text):
+                piece_cost = estimate_text_tokens(piece)
+                if self._parts and self._used + piece_cost + SEPARATOR_TOKENS > self.budget:
+                    completed += self._close()
+                    if previous is not None:
+                        tail = _tail(previous[1], self.overlap)
+                        tail_block = _page_block(previous[0], tail, " (end, repeated)")
+                        tail_cost = estimate_text_tokens(tail_block)
+                        if tail and tail_cost + piece_cost + 2 * SEPARATOR_TOKENS <= self.budget:
+                            self._add(previous[0], tail_block, tail_cost)
+                self._add(page_number, piece, piece_cost)
+                previous = (page_number, piece)
+        return completed
+
+    def finish(self):
+        return self._close()
+
+
+def pack_pages(numbered, selected, budget, overlap=OVERLAP_TOKENS):
+    """All windows for the selected indexes of numbered, in page order."""
+    packer = WindowPacker(budget, overlap)
+    windows = []
+    for run in page_runs(numbered, selected):
+        windows += packer.add_run(run)
+    return windows + packer.finish()
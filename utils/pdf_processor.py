@@ -1,27 +1,151 @@
 # utils/pdf_processor.py
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pdfplumber
+from utils.telemetry import span, record_span
 
 # NOTE: We are removing OCR from the primary flow for now to focus on the chunking problem.
 # Digital extraction is much more reliable for financial reports.
 
-def extract_pages_from_pdf(pdf_path):
+# Below this many pages, process start-up costs more than it saves.
+PARALLEL_MIN_PAGES = 40
+# Each worker gets several smaller ranges so a slow chunk does not hold up the pool.
+CHUNKS_PER_WORKER = 4
+
+
+def _iter_page_range(pdf_path, start, stop):
     """
-    Extracts text from a PDF file, returning a list where each item is the text of one page.
+    Opens the PDF independently and yields (page_number, text) tuples for
+    pages [start, stop), skipping pages without text.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        for index in range(start, stop):
+            page = pdf.pages[index]
+            text = page.extract_text()
+            # Release the parsed layout objects; we only need the text.
+            page.close()
+            if text:
+                yield index + 1, text
+
+
+def _extract_page_range(pdf_path, start, stop):
+    """Worker task: returns the pages in [start, stop) as a list for pickling."""
+    return list(_iter_page_range(pdf_path, start, stop))
+
+
+def _split_range(page_count, chunks):
+    """Splits range(page_count) into up to `chunks` contiguous (start, stop) ranges."""
+    chunks = max(1, min(chunks, page_count))
+    size, extra = divmod(page_count, chunks)
+    ranges, start = [], 0
+    for i in range(chunks):
+        stop = start + size + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def _iter_numbered_pages(pdf_path, workers):
+    """
+    Yields (page_number, text) tuples in page order as soon as they are parsed.
+    In parallel mode only a few ranges are outstanding at once, so finished
+    pages are not held in memory ahead of the consumer.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        page_count = len(pdf.pages)
+
+    if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+        yield from _iter_page_range(pdf_path, 0, page_count)
+        return
+
+    ranges = _split_range(page_count, workers * CHUNKS_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        outstanding = deque()
+        for start, stop in ranges:
+            outstanding.append(executor.submit(_extract_page_range, pdf_path, start, stop))
+            # Keep every worker busy plus one range queued each, no more.
+            if len(outstanding) >= workers * 2:
+                yield from outstanding.popleft().result()
+        while outstanding:
+            yield from outstanding.popleft().result()
+
+
+def extract_page_words(pdf_path, page_number):
+    """
+    Returns pdfplumber's positioned words (text, x0, x1, top, bottom) for one
+    page, for geometry-based table reading. page_number is 1-based.
     """
-    page_texts = []
     try:
         with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                text = page.extract_text()
-                if text:
-                    page_texts.append(text)
-        
-        if not page_texts:
+            page = pdf.pages[page_number - 1]
+            words = page.extract_words(keep_blank_chars=False, use_text_flow=False)
+            page.close()
+            return words
+    except Exception as e:
+        print(f"Error reading words from page {page_number}: {e}")
+        return None
+
+
+def _stream_pages(pdf_path, workers):
+    # The pdf_parse span counts only time spent parsing, not time the
+    # consumer spends on a page before asking for the next one. A PDF that
+    # cannot be read, or has no text at all, raises so the job records why.
+    parse_seconds, pages, status = 0.0, 0, "ok"
+    iterator = _iter_numbered_pages(pdf_path, workers)
+    try:
+        while True:
+            started = time.perf_counter()
+            item = next(iterator, None)
+            parse_seconds += time.perf_counter() - started
+            if item is None:
+                break
+            pages += 1
+            yield item
+    except Exception as e:
+        status = "error"
+        print(f"Error reading PDF with pdfplumber: {e}")
+        raise RuntimeError(f"Could not read the PDF: {e}") from e
+    finally:
+        iterator.close()
+        record_span("pdf_parse", parse_seconds, status=status, pages=pages, workers=workers, streamed=True)
+    if not pages:
+        print("Warning: pdfplumber extracted no pages with text.")
+        raise RuntimeError("No text could be extracted from the PDF. It may be a scanned image without a text layer.")
+
+
+def extract_pages_from_pdf(pdf_path, workers=1, with_page_numbers=False, stream=False):
+    """
+    Extracts text from a PDF file, returning a list where each item is the text of one page.
+
+    With workers > 1 (or workers=None for one per CPU), documents of
+    PARALLEL_MIN_PAGES or more are split into page ranges and parsed on a
+    process pool. Pages always come back in their original order. Set
+    with_page_numbers=True to get (page_number, text) tuples instead.
+
+    With stream=True, returns an iterator of (page_number, text) tuples that
+    yields pages as they are parsed, for process_pdf_pages to consume directly.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if stream:
+        return _stream_pages(pdf_path, workers)
+
+    try:
+        with span("pdf_parse", workers=workers, streamed=False) as parse:
+            numbered_pages = list(_iter_numbered_pages(pdf_path, workers))
+            parse.set(pages=len(numbered_pages))
+
+        if not numbered_pages:
             print("Warning: pdfplumber extracted no pages with text.")
             return None
-        
-        return page_texts
+
+        if with_page_numbers:
+            return numbered_pages
+        return [text for _, text in numbered_pages]
     except Exception as e:
         print(f"Error reading PDF with pdfplumber: {e}")
         # Here you could add the OCR fallback if needed, but it's often less reliable for tables.
-        return None
\ No newline at end of file
+        return None
@@ -26,100 +26,18 @@ def create_line_chart(df, x_col, y_col, title):
     )
     return fig
 
-def create_asset_liability_chart(df):
-    """Creates a grouped bar chart comparing assets and liabilities over years."""
-    fig = go.Figure()
-    
-    df['value'] = pd.to_numeric(df['value'])
-    df['year'] = pd.to_numeric(df['year'])
-    df = df.sort_values('year')
-
-    assets_df = df[df['metric'] == 'Total Assets']
-    liabilities_df = df[df['metric'] == 'Total Liabilities']
-
-    if not assets_df.empty:
-        fig.add_trace(go.Bar(x=assets_df['year'], y=assets_df['value'], name='Total Assets', marker_color='lightgreen'))
-    if not liabilities_df.empty:
-        fig.add_trace(go.Bar(x=liabilities_df['year'], y=liabilities_df['value'], name='Total Liabilities', marker_color='indianred'))
-
-    fig.update_layout(
-        barmode='group',
-        title_text="Total Assets vs. Total Liabilities Over Years",
-        xaxis_title="Year",
-        yaxis_title="Value",
-        template="plotly_dark",
-        xaxis=dict(type='category')
-    )
-    return fig
-
-# --- NEW FUNCTION FOR GROWTH PLOTTING ---
-def create_growth_chart(df, metric_name, title):
-    """
-    Calculates and plots the year-over-year growth of a specific metric.
-    """
-    # 1. Filter the DataFrame for the specific metric
-    metric_df = df[df['metric'] == metric_name].copy()
-    
-    # 2. Ensure data is numeric and sorted by year
-    metric_df['value'] = pd.to_numeric(metric_df['value'])
-    metric_df = metric_df.sort_values('year')
-
-    # 3. Calculate Year-over-Year (YoY) percentage growth
-    # pct_change() is a powerful pandas function for this
-    metric_df['growth_pct'] = metric_df['value'].pct_change() * 100
-    
-    # The first year will have NaN growth, so we drop it for a cleaner plot
-    metric_df.dropna(subset=['growth_pct'], inplace=True)
-    
-    if metric_df.empty:
-        # Return None if there's not enough data to calculate growth (e.g., only one year)
-        return None
-
-    # 4. Create the bar chart for growth
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
-        x=metric_df['year'],
-        y=metric_df['growth_pct'],
-        name='YoY Growth',
-        # Add text labels on the bars for clarity
-        text=metric_df['growth_pct'].apply(lambda x: f'{x:+.2f}%'),
-        textposition='auto'
-    ))
-    
-    fig.update_layout(
-        title_text=title,
-        xaxis_title="Year",
-        yaxis_title="Year-over-Year Growth (%)",
-        template="plotly_dark",
-        xaxis=dict(type='category'),
-        yaxis=dict(ticksuffix="%")
-    )
-    
-    return fig# utils/plotting.py
-import plotly.graph_objects as go
-import pandas as pd
-
-def create_bar_chart(df, x_col, y_col, title):
-    """Creates an interactive bar chart using Plotly."""
+def create_stacked_bar_chart(df, x_col, y_col, color_col, title):
+    """Creates a stacked bar chart with one segment per value of color_col."""
     fig = go.Figure()
-    fig.add_trace(go.Bar(x=df[x_col], y=df[y_col], name=title, text=df[y_col], texttemplate='%{y:,.2f}', textposition='outside'))
+    for name, part in df.sort_values(x_col).groupby(color_col, sort=True):
+        fig.add_trace(go.Bar(x=part[x_col], y=part[y_col], name=str(name)))
     fig.update_layout(
+        barmode='stack',
         title_text=title,
         xaxis_title=x_col.capitalize(),
         yaxis_title="Value (units as per report)",
-        template="plotly_dark"
-    )
-    return fig
-
-def create_line_chart(df, x_col, y_col, title):
-    """Creates an interactive line chart for trends."""
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=df[x_col], y=df[y_col], mode='lines+markers', name=title))
-    fig.update_layout(
-        title_text=title,
-        xaxis_title=x_col.capitalize(),
-        yaxis_title="Value (units as per report)",
-        template="plotly_dark"
+        template="plotly_dark",
+        xaxis=dict(type='category')
     )
     return fig
 
@@ -127,9 +45,8 @@ def create_asset_liability_chart(df):
     """Creates a grouped bar chart comparing assets and liabilities over years."""
     fig = go.Figure()
     
-    df['value'] = pd.to_numeric(df['value'])
-    df['year'] = pd.to_numeric(df['year'])
-    df = df.sort_values('year')
+    # assign() returns a new frame, so the caller's df is never modified
+    df = df.assign(value=pd.to_numeric(df['value']), year=pd.to_numeric(df['year'])).sort_values('year')
 
     assets_df = df[df['metric'] == 'Total Assets']
     liabilities_df = df[df['metric'] == 'Total Liabilities']
@@ -154,19 +71,18 @@ def create_growth_chart(df, metric_name, title):
     """
     Calculates and plots the year-over-year growth of a specific metric.
     """
-    # 1. Filter the DataFrame for the specific metric
-    metric_df = df[df['metric'] == metric_name].copy()
+    # 1. Filter the DataFrame for the specific metric (a new frame; df is left untouched)
+    metric_df = df.loc[df['metric'] == metric_name, ['year', 'value']]
     
     # 2. Ensure data is numeric and sorted by year
-    metric_df['value'] = pd.to_numeric(metric_df['value'])
-    metric_df = metric_df.sort_values('year')
+    metric_df = metric_df.assign(value=pd.to_numeric(metric_df['value'])).sort_values('year')
 
     # 3. Calculate Year-over-Year (YoY) percentage growth
     # pct_change() is a powerful pandas function for this
-    metric_df['growth_pct'] = metric_df['value'].pct_change() * 100
+    metric_df = metric_df.assign(growth_pct=metric_df['value'].pct_change() * 100)
     
     # The first year will have NaN growth, so we drop it for a cleaner plot
-    metric_df.dropna(subset=['growth_pct'], inplace=True)
+    metric_df = metric_df.dropna(subset=['growth_pct'])
     
     if metric_df.empty:
         # Return None if there's not enough data to calculate growth (e.g., only one year)
@@ -193,3 +109,26 @@ def create_growth_chart(df, metric_name, title):
     )
     
     return fig
+
+def build_plot_figure(plot_request, df):
+    """
+    Builds the figure for a chat plot_request ({"type", "metric", "title"})
+    from long-form year/metric/value rows. Returns None when the request
+    names an unknown type or a metric that is not in df.
+    """
+    plot_type = plot_request.get("type")
+    metric = plot_request.get("metric")
+    title = plot_request.get("title")
+
+    if plot_type in ["line", "bar"] and metric and metric in df['metric'].unique():
+        plot_df = df[df['metric'] == metric].sort_values('year')
+        if plot_type == "line":
+            return create_line_chart(plot_df, 'year', 'value', title)
+        return create_bar_chart(plot_df, 'year', 'value', title)
+
+    elif plot_type == "asset_liability_comparison":
+        return create_asset_liability_chart(df)
+
+    elif plot_type == "growth" and metric and metric in df['metric'].unique():
+        return create_growth_chart(df, metric, title)
+    return None
@@ -0,0 +1,119 @@
+# utils/ratios.py
+import numpy as np
+import pandas as pd
+from utils.database import get_db_connection
+from utils.chat_context import encode_frame_csv
+
+# Standard ratio set computed with array operations over a
+# company x year x metric cube, so the chat model is handed the ratios
+# instead of having to derive them from a text table.
+
+# name -> (numerator, denominator, scale, denominator must be positive)
+RATIO_DEFINITIONS = {
+    "Current Ratio": ("Current assets", "Current liabilities", 1.0, False),
+    # No separate borrowings line is extracted, so total liabilities stand in for debt.
+    "Debt to Equity": ("Total Liabilities", "Total Equity", 1.0, True),
+    "Return on Equity (%)": ("Net Profit", "Total Equity", 100.0, True),
+    "Return on Assets (%)": ("Net Profit", "Total Assets", 100.0, True),
+}
+EPS_METRIC = "Earnings Per Share (Basic)"
+EPS_GROWTH = "EPS Growth (%)"
+RATIO_NAMES = list(RATIO_DEFINITIONS) + [EPS_GROWTH]
+
+
+def load_financial_cube():
+    """
+    Reads financial_data for every company in one query and returns
+    (company_ids, years, metrics, cube) where cube[c, y, m] is the value
+    for company_ids[c], years[y], metrics[m], or NaN when not reported.
+    """
+    conn = get_db_connection()
+    rows = conn.execute(
+        "SELECT f.company_id, f.year, m.name, f.value FROM financial_data f JOIN metrics m ON m.id = f.metric_id"
+    ).fetchall()
+    if not rows:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([], dtype=object), np.empty((0, 0, 0))
+
+    company_col, year_col, metric_col, value_col = (np.array(col) for col in zip(*rows))
+    company_ids, company_idx = np.unique(company_col.astype(int), return_inverse=True)
+    years, year_idx = np.unique(year_col.astype(int), return_inverse=True)
+    metrics, metric_idx = np.unique(metric_col.astype(str), return_inverse=True)
+
+    cube = np.full((len(company_ids), len(years), len(metrics)), np.nan)
+    cube[company_idx, year_idx, metric_idx] = value_col.astype(float)
+    return company_ids, years, metrics.astype(object), cube
+
+
+def _metric_slice(cube, metrics, name):
+    """cube[:, :, metric] for a metric name, all NaN if no company reports it."""
+    position = np.flatnonzero(metrics == name)
+    if len(position) == 0:
+        return np.full(cube.shape[:2], np.nan)
+    return cube[:, :, position[0]]
+
+
+def _safe_divide(numerator, denominator, positive_only=False):
+    """Element-wise division that yields NaN for missing, zero or (optionally) negative denominators."""
+    valid = np.isfinite(numerator) & np.isfinite(denominator)
+    valid &= (denominator > 0) if positive_only else (denominator != 0)
+    out = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=valid)
+    return out
+
+
+def compute_ratios(years, metrics, cube):
+    """
+    Returns a company x year x ratio array in RATIO_NAMES order. EPS growth
+    is only computed between consecutive fiscal years and against a
+    non-zero prior EPS; anything that cannot be computed is NaN.
+    """
+    ratios = np.full(cube.shape[:2] + (len(RATIO_NAMES),), np.nan)
+    for position, (numerator, denominator, scale, positive_only) in enumerate(RATIO_DEFINITIONS.values()):
+        ratios[:, :, position] = _safe_divide(_metric_slice(cube, metrics, numerator),
+                                              _metric_slice(cube, metrics, denominator), positive_only) * scale
+
+    if len(years) > 1:
+        eps = _metric_slice(cube, metrics, EPS_METRIC)
+        consecutive = np.diff(years) == 1
+        change = _safe_divide(eps[:, 1:] - eps[:, :-1], np.abs(eps[:, :-1]))
+        ratios[:, 1:, -1] = np.where(consecutive, change * 100.0, np.nan)
+    return ratios
+
+
+def build_ratio_table():
+    """
+    Loads every company's data and returns the full ratio set as a
+    DataFrame indexed by (company_id, year) with one column per ratio.
+    Rows where no ratio could be computed are left out.
+    """
+    company_ids, years, metrics, cube = load_financial_cube()
+    ratios = compute_ratios(years, metrics, cube)
+    index = pd.MultiIndex.from_product([company_ids, years], names=["company_id", "year"])
+    table = pd.DataFrame(ratios.reshape(-1, len(RATIO_NAMES)), index=index, columns=RATIO_NAMES)
+    return table.dropna(how="all")
+
+
+def company_ratio_frame(ratio_table, company_id):
+    """One company's ratios as a ratio x year frame, matching the snapshot layout."""
+    if company_id not in ratio_table.index.get_level_values("company_id"):
+        return pd.DataFrame(columns=pd.Index([], name="year"), dtype=float)
+    frame = ratio_table.xs(company_id, level="company_id").T
+    frame.index.name = "ratio"
+    return frame.dropna(how="all")
+
+
+def snapshot_ratio_frame(snapshot_df):
+    """Ratios for a single metric x year frame (e.g. a group roll-up), as a ratio x year frame."""
+    years = np.asarray(snapshot_df.columns, dtype=int)
+    metrics = np.asarray(snapshot_df.index, dtype=object)
+    cube = snapshot_df.to_numpy(dtype=float).T[np.newaxis]
+    frame = pd.DataFrame(compute_ratios(years, metrics, cube)[0].T, index=pd.Index(RATIO_NAMES, name="ratio"),
+                         columns=pd.Index(years, name="year"))
+    return frame.dropna(how="all")
+
+
+def format_ratio_summary(ratio_frame):
+    """Text rendering of a company's ratios for the chat prompt."""
+    if ratio_frame.empty:
+        return "No ratios could be computed from the available data."
+    return encode_frame_csv(ratio_frame, with_units=False, significant_digits=4)
@@ -0,0 +1,282 @@
+# utils/statement_parser.py
+import re
+
+# Deterministic extractor for Schedule III statements. Most Indian annual
+# reports print the balance sheet and P&L with standard labels, so the
+# REQUIRED_KEYS can often be read straight off the page without an LLM call.
+# Amounts are normalized to crore, the unit the Reliance reports print in;
+# llm_helper rescales the LLM's answers with the same detect_unit_scale.
+
+# Exact row labels (lowercased, without notes or parenthetical text).
+ROW_LABELS = {
+    "Revenue from Operations": ["revenue from operations", "income from operations"],
+    "Other Income": ["other income"],
+    "Total Income": ["total income", "total revenue"],
+    "Profit Before Tax": ["profit before tax", "profit/(loss) before tax", "profit before taxation"],
+    "Net Profit": ["profit for the year", "profit for the period", "profit after tax", "net profit", "profit/(loss) for the year"],
+    "Total Equity": ["total equity"],
+    "Total Assets": ["total assets"],
+    "Total Liabilities": ["total liabilities"],
+    "Non-current assets": ["total non-current assets", "total non current assets"],
+    "Current assets": ["total current assets"],
+    "Non-current liabilities": ["total non-current liabilities", "total non current liabilities"],
+    "Current liabilities": ["total current liabilities"],
+    "Cash and cash equivalents": ["cash and cash equivalents"],
+    "Earnings Per Share (Basic)": ["basic", "basic eps", "basic earnings per share"],
+}
+
+# Rows that are not REQUIRED_KEYS but let us derive one that is missing.
+AUX_LABELS = {
+    "Total Equity and Liabilities": ["total equity and liabilities"],
+}
+
+# Per-share figures are never rescaled.
+UNSCALED_KEYS = {"Earnings Per Share (Basic)"}
+# The unit every stored amount is in, and the one per-share figures are in.
+AMOUNT_UNIT = "Rs crore"
+PER_SHARE_UNIT = "Rs per share"
+
+STATEMENT_TITLES = ["balance sheet", "statement of profit and loss", "profit and loss account"]
+# The title sits in the running header, within the first few lines of the page.
+STATEMENT_TITLE_LINES = 6
+
+# Multipliers that convert a reported amount into crore. The unit follows
+# "in", optionally after a currency ("in Rs. lakhs", "in INR million"), or
+# a currency sign directly ("(Rs '000)"); "in millions of ..." is prose.
+_IN_UNIT = r"\bin\s+(?:(?:₹|rs\.?|inr|rupees)\s*)?(?:{units})\b(?!\s+of\b)"
+UNIT_SCALES = [
+    (re.compile(_IN_UNIT.format(units=r"lakhs?|lacs?")), 0.01),
+    (re.compile(_IN_UNIT.format(units=r"crores?|cr")), 1.0),
+    (re.compile(_IN_UNIT.format(units=r"millions?|mn")), 0.1),
+    (re.compile(_IN_UNIT.format(units=r"billions?|bn")), 100.0),
+    (re.compile(_IN_UNIT.format(units=r"thousands?|['’]000")), 0.0001),
+    (re.compile(r"(?:₹|\brs\.?|\binr)\s*['’]000\b"), 0.0001),
+]
+
+AMOUNT_PATTERN = re.compile(r"^\(?-?\d[\d,]*(?:\.\d+)?\)?$")
+DASHES = {"-", "–", "—"}
+FY_PATTERN = re.compile(r"\b((?:19|20)\d\d)\s*-\s*(\d\d)\b")
+YEAR_PATTERN = re.compile(r"\b((?:19|20)\d\d)\b")
+
+# Words whose right edges are this close belong to the same column, and words
+# whose tops are within ROW_TOLERANCE share a row (PDF points).
+COLUMN_TOLERANCE = 20
+ROW_TOLERANCE = 3
+
+
+def parse_amount(token):
+    """
+    Converts a printed amount into a float. Handles Indian digit grouping
+    (1,46,635), parenthesized negatives (5) and dashes for nil.
+    Returns None if the token is not an amount.
+    """
+    token = token.strip()
+    if token in DASHES:
+        return 0.0
+    if not AMOUNT_PATTERN.match(token):
+        return None
+    negative = token.startswith("(") and token.endswith(")")
+    number = float(token.strip("()").replace(",", ""))
+    return -number if negative else number
+
+
+def detect_unit_scale(text, default=1.0):
+    """
+    Returns the multiplier that converts the page's amounts into crore, from
+    the first unit declaration on the page, or default if it declares none.
+
+    >>> [detect_unit_scale(h) for h in ["(Amount in ₹ lakh)", "(₹ in thousands)", "(All amounts in INR million)"]]
+    [0.01, 0.0001, 0.1]
+    >>> [detect_unit_scale(h) for h in ["(Amount in Rs. Lakhs)", "(₹ in crore)", "(Rs '000)", "in billions"]]
+    [0.01, 1.0, 0.0001, 100.0]
+    >>> detect_unit_scale("served 450 in millions of homes", default=None) is None
+    True
+    """
+    lowered = text.lower()
+    matches = [(match.start(), scale) for pattern, scale in UNIT_SCALES for match in [pattern.search(lowered)] if match]
+    return min(matches)[1] if matches else default
+
+
+def _normalize_label(label):
+    label = re.sub(r"\(in [^)]*\)|\(`[^)]*\)|\(₹[^)]*\)", "", label.lower())
+    label = re.sub(r"^\(?[ivx]+\)\s*|^[a-z]\)\s*", "", label.strip())
+    return re.sub(r"\s+", " ", label).strip(" :.-")
+
+
+def _period_years(line):
+    """Returns the reporting years named in a header line, in column order."""
+    years = []
+    for match in FY_PATTERN.finditer(line):
+        years.append((match.start(), int(match.group(1)), int(match.group(1)[:2] + match.group(2))))
+    taken = [(m.start(), m.end()) for m in FY_PATTERN.finditer(line)]
+    for match in YEAR_PATTERN.finditer(line):
+        if any(start <= match.start() < end for start, end in taken):
+            continue
+        years.append((match.start(), int(match.group(1)), int(match.group(1))))
+    years.sort()
+    return [(start_year, end_year) for _, start_year, end_year in years]
+
+
+def _current_column(periods, year):
+    """Picks the column for `year`; reports print the current year first."""
+    for index, (start_year, end_year) in enumerate(periods):
+        if end_year == year:
+            return index
+    for index, (start_year, end_year) in enumerate(periods):
+        if start_year == year:
+            return index
+    return 0
+
+
+def _find_header(lines):
+    """Returns (line_index, periods) for the first line naming two or more periods."""
+    for index, line in enumerate(lines):
+        periods = _period_years(line)
+        if len(periods) >= 2:
+            return index, periods
+    return None, []
+
+
+def _split_row(line):
+    """Splits a text line into its label and trailing amount tokens."""
+    tokens = line.split()
+    amounts = []
+    while tokens and parse_amount(tokens[-1]) is not None:
+        amounts.insert(0, tokens.pop())
+    return " ".join(tokens), amounts
+
+
+def _match_key(label):
+    normalized = _normalize_label(label)
+    for key, labels in list(ROW_LABELS.items()) + list(AUX_LABELS.items()):
+        if normalized in labels:
+            return key
+    return None
+
+
+def _rows_from_text(text, column_count, column):
+    """Yields (label, amount_token) pairs read from plain text lines."""
+    for line in text.splitlines():
+        label, amounts = _split_row(line)
+        # A note reference may precede the amounts, so read from the right.
+        if label and len(amounts) >= column_count:
+            yield label, amounts[len(amounts) - column_count + column]
+
+
+def _group_rows(words):
+    """Groups pdfplumber words into rows of words sharing a baseline, left to right."""
+    rows = []
+    for word in sorted(words, key=lambda w: (w["top"], w["x0"])):
+        if rows and abs(rows[-1][0] - word["top"]) <= ROW_TOLERANCE:
+            rows[-1][1].append(word)
+        else:
+            rows.append((word["top"], [word]))
+    return [sorted(row_words, key=lambda w: w["x0"]) for _, row_words in rows]
+
+
+def _amount_column_edges(rows, column_count):
+    """
+    Clusters the right edges of amount words and returns the rightmost
+    column_count clusters, left to right. Amounts are right-aligned, so each
+    cluster is one printed column.
+    """
+    edges = sorted(word["x1"] for row in rows for word in row if parse_amount(word["text"]) is not None)
+    clusters = []
+    for edge in edges:
+        if clusters and edge - clusters[-1][-1] <= COLUMN_TOLERANCE:
+            clusters[-1].append(edge)
+        else:
+            clusters.append([edge])
+    # Ignore stray numbers (page numbers, dates) that form tiny clusters.
+    clusters = [c for c in clusters if len(c) >= 3]
+    if len(clusters) < column_count:
+        return None
+    return [sum(c) / len(c) for c in clusters[-column_count:]]
+
+
+def _rows_from_words(rows, column_edge):
+    """
+    Yields (label, amount_token) pairs using word geometry. The amount is the
+    word right-aligned under the current-year column, so blank cells and note
+    columns are never confused with it.
+    """
+    for row_words in rows:
+        label_words = []
+        amount = None
+        for word in row_words:
+            if parse_amount(word["text"]) is None:
+                if amount is None:
+                    label_words.append(word["text"])
+            elif abs(word["x1"] - column_edge) <= COLUMN_TOLERANCE:
+                amount = word["text"]
+        if label_words and amount is not None:
+            yield " ".join(label_words), amount
+
+
+def is_statement_page(text):
+    """True if the page opens with a primary statement title (notes pages do not)."""
+    heading = "\n".join(text.lower().splitlines()[:STATEMENT_TITLE_LINES])
+    if heading.lstrip().startswith("notes"):
+        return False
+    return any(title in heading for title in STATEMENT_TITLES)
+
+
+def is_continuation_page(text):
+    """
+    True if the page carries on a statement from the page before: no title
+    of its own, but a statement's period header within its opening lines.
+    """
+    if not text or is_statement_page(text):
+        return False
+    opening = text.lower().splitlines()[:STATEMENT_TITLE_LINES]
+    if any("statement" in line or "notes to" in line for line in opening):
+        return False
+    return _find_header(opening)[0] is not None
+
+
+def parse_statement_page(text, year, words=None):
+    """
+    Reads REQUIRED_KEYS values straight off a balance sheet or P&L page.
+    `words` are pdfplumber words for the page (see extract_page_words); when
+    given, the current-year column is located by geometry instead of by
+    counting tokens from the right. Returns a dict of the keys it found.
+    """
+    if not text or not is_statement_page(text):
+        return {}
+
+    lines = text.splitlines()
+    _, periods = _find_header(lines)
+    column_count = max(len(periods), 2)
+    column = _current_column(periods, year) if periods else 0
+    scale = detect_unit_scale(text)
+
+    rows = None
+    if words:
+        word_rows = _group_rows(words)
+        edges = _amount_column_edges(word_rows, column_count)
+        if edges:
+            rows = _rows_from_words(word_rows, edges[column])
+    if rows is None:
+        rows = _rows_from_text(text, column_count, column)
+
+    # A bare "Basic" row only means EPS on a page that reports earnings per share.
+    has_eps = "earnings per" in text.lower()
+
+    found = {}
+    for label, token in rows:
+        key = _match_key(label)
+        if key == "Earnings Per Share (Basic)" and not has_eps:
+            continue
+        if key is None or key in found:
+            continue
+        value = parse_amount(token)
+        if value is None:
+            continue
+        found[key] = value if key in UNSCALED_KEYS else round(value * scale, 4)
+
+    # Many balance sheets omit a Total Liabilities row; derive it when possible.
+    total = found.pop("Total Equity and Liabilities", None)
+    if "Total Liabilities" not in found and total is not None and "Total Equity" in found:
+        found["Total Liabilities"] = round(total - found["Total Equity"], 4)
+
+    return found
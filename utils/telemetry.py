@@ -0,0 +1,261 @@
+# utils/telemetry.py
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import utils.database as database
+
+# Timing spans for the ingest and chat pipelines. A span covers one stage
+# (see STAGES) and records its duration, outcome, token counts and retries.
+# Spans are buffered in memory and written to the stage_spans table in
+# batches, so timing a page never costs a database write of its own.
+#
+#     with span("llm_call", model=model_name) as call:
+#         response = ...
+#         call.set(prompt_tokens=..., completion_tokens=...)
+#
+# The admin page (pages/pipeline_metrics.py) and `python -m utils.telemetry`
+# read them back as rolling percentiles or Prometheus text.
+
+STAGES = ("pdf_parse", "llm_call", "json_parse", "merge", "db_save", "dashboard_load", "chat_turn")
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Buffered spans are written once this many are waiting, or this many seconds after the last write.
+FLUSH_BATCH_SIZE = 50
+FLUSH_INTERVAL_SECONDS = 5.0
+RETENTION_SECONDS = 7 * 24 * 3600
+PRUNE_INTERVAL_SECONDS = 3600
+
+SPAN_FIELDS = ("status", "prompt_tokens", "completion_tokens", "retries")
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_last_flush = time.monotonic()
+_ready = set()        # DB_NAME values whose stage_spans table exists
+_last_prune = {}      # DB_NAME -> time of the last retention sweep
+
+
+def _ensure_table(conn):
+    if database.DB_NAME in _ready:
+        return
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stage_spans (
+            id INTEGER PRIMARY KEY,
+            stage TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            seconds REAL NOT NULL,
+            status TEXT NOT NULL,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            retries INTEGER NOT NULL DEFAULT 0,
+            attrs TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_stage_spans_stage_started ON stage_spans (stage, started_at)")
+    conn.commit()
+    _ready.add(database.DB_NAME)
+
+
+class Span:
+    """The span being timed; set() attaches token counts, retries or any other attribute."""
+
+    def __init__(self, stage, attrs):
+        self.stage = stage
+        self.status = "ok"
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.retries = 0
+        self.attrs = dict(attrs)
+
+    def set(self, **fields):
+        for name, value in fields.items():
+            if name in SPAN_FIELDS:
+                setattr(self, name, value)
+            else:
+                self.attrs[name] = value
+
+
+@contextmanager
+def span(stage, **attrs):
+    """Times the enclosed block as one span of stage; an exception marks it 'error'."""
+    current = Span(stage, attrs)
+    started_at = time.time()
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        current.status = "error"
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - started, status=current.status, started_at=started_at,
+                    prompt_tokens=current.prompt_tokens, completion_tokens=current.completion_tokens,
+                    retries=current.retries, **current.attrs)
+
+
+def record_span(stage, seconds, status="ok", started_at=None, prompt_tokens=None, completion_tokens=None,
+                retries=0, **attrs):
+    """Records a span measured by the caller (e.g. time summed over many small steps)."""
+    if started_at is None:
+        started_at = time.time() - seconds
+    row = (stage, started_at, seconds, status, prompt_tokens, completion_tokens, retries or 0,
+           json.dumps(attrs, default=str) if attrs else None)
+    with _buffer_lock:
+        _buffer.append(row)
+        due = len(_buffer) >= FLUSH_BATCH_SIZE or time.monotonic() - _last_flush >= FLUSH_INTERVAL_SECONDS
+    if due:
+        flush_spans()
+
+
+def flush_spans():
+    """Writes buffered spans to the database. Telemetry never breaks the pipeline, so errors only print."""
+    global _last_flush
+    with _buffer_lock:
+        rows = _buffer[:]
+        _buffer.clear()
+        _last_flush = time.monotonic()
+    if not rows:
+        return 0
+    try:
+        conn = database.get_db_connection()
+        _ensure_table(conn)
+        with conn:
+            conn.executemany(
+                "INSERT INTO stage_spans (stage, started_at, seconds, status, prompt_tokens, completion_tokens, retries, attrs) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            if time.time() - _last_prune.get(database.DB_NAME, 0.0) >= PRUNE_INTERVAL_SECONDS:
+                conn.execute("DELETE FROM stage_spans WHERE started_at < ?", (time.time() - RETENTION_SECONDS,))
+                _last_prune[database.DB_NAME] = time.time()
+    except sqlite3.Error as e:
+        print(f"Error writing {len(rows)} telemetry spans: {e}")
+        return 0
+    return len(rows)
+
+
+# Short-lived processes (the batch CLI, benchmarks) write whatever is still buffered on exit.
+atexit.register(flush_spans)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile; None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+def get_recent_spans(limit=50, stage=None):
+    """The newest spans first, as dicts with attrs decoded."""
+    flush_spans()
+    conn = database.get_db_connection()
+    _ensure_table(conn)
+    query = "SELECT stage, started_at, seconds, status, prompt_tokens, completion_tokens, retries, attrs FROM stage_spans"
+    params = ()
+    if stage is not None:
+        query += " WHERE stage = ?"
+        params = (stage,)
+    rows = conn.execute(query + " ORDER BY started_at DESC LIMIT ?", (*params, limit)).fetchall()
+    return [dict(row, attrs=json.loads(row["attrs"]) if row["attrs"] else {}) for row in rows]
+
+
+def stage_summary(window_seconds=3600):
+    """
+    Rolling statistics per stage over the last window_seconds: span and
+    error counts, p50/p95/p99 and total seconds, token and retry totals.
+    Stages come back in STAGES order, followed by any others seen.
+    """
+    flush_spans()
+    conn = database.get_db_connection()
+    _ensure_table(conn)
+    rows = conn.execute(
+        "SELECT stage, seconds, status, prompt_tokens, completion_tokens, retries FROM stage_spans WHERE started_at >= ?",
+        (time.time() - window_seconds,)
+    ).fetchall()
+
+    by_stage = {}
+    for row in rows:
+        by_stage.setdefault(row["stage"], []).append(row)
+
+    summary = []
+    for stage in sorted(by_stage, key=lambda name: (STAGES.index(name) if name in STAGES else len(STAGES), name)):
+        spans = by_stage[stage]
+        seconds = [row["seconds"] for row in spans]
+        entry = {"stage": stage, "count": len(spans), "errors": sum(row["status"] != "ok" for row in spans)}
+        for quantile in QUANTILES:
+            entry[f"p{round(quantile * 100)}_seconds"] = percentile(seconds, quantile)
+        entry["total_seconds"] = sum(seconds)
+        entry["prompt_tokens"] = sum(row["prompt_tokens"] or 0 for row in spans)
+        entry["completion_tokens"] = sum(row["completion_tokens"] or 0 for row in spans)
+        entry["retries"] = sum(row["retries"] for row in spans)
+        summary.append(entry)
+    return summary
+
+
+def prometheus_text(window_seconds=3600):
+    """stage_summary() in the Prometheus text exposition format."""
+    summary = stage_summary(window_seconds)
+    lines = [
+        f"# HELP finanalyst_stage_seconds Duration of pipeline stages over the last {window_seconds:g}s.",
+        "# TYPE finanalyst_stage_seconds summary",
+    ]
+    for entry in summary:
+        label = f'stage="{entry["stage"]}"'
+        for quantile in QUANTILES:
+            lines.append(f'finanalyst_stage_seconds{{{label},quantile="{quantile:g}"}} '
+                         f'{entry[f"p{round(quantile * 100)}_seconds"]:.6f}')
+        lines.append(f"finanalyst_stage_seconds_sum{{{label}}} {entry['total_seconds']:.6f}")
+        lines.append(f"finanalyst_stage_seconds_count{{{label}}} {entry['count']}")
+
+    gauges = [
+        ("finanalyst_stage_errors", "Failed spans per stage", lambda entry: [("", entry["errors"])]),
+        ("finanalyst_stage_tokens", "LLM tokens per stage",
+         lambda entry: [(',kind="prompt"', entry["prompt_tokens"]), (',kind="completion"', entry["completion_tokens"])]),
+        ("finanalyst_stage_retries", "Retried requests per stage", lambda entry: [("", entry["retries"])]),
+    ]
+    for name, description, values in gauges:
+        lines.append(f"# HELP {name} {description} over the last {window_seconds:g}s.")
+        lines.append(f"# TYPE {name} gauge")
+        for entry in summary:
+            for extra_label, value in values(entry):
+                lines.append(f'{name}{{stage="{entry["stage"]}"{extra_label}}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(port, window_seconds=3600):
+    """Serves prometheus_text() at http://localhost:<port>/metrics until interrupted."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text(window_seconds).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"Serving pipeline metrics at http://127.0.0.1:{port}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Print or serve the pipeline timing spans as Prometheus text.")
+    parser.add_argument("--window", type=float, default=3600, help="Rolling window in seconds (default 3600)")
+    parser.add_argument("--serve", type=int, metavar="PORT", help="Serve /metrics on this port instead of printing once")
+    args = parser.parse_args()
+    if args.serve:
+        serve_prometheus(args.serve, args.window)
+    else:
+        print(prometheus_text(args.window), end="")